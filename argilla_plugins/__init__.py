@@ -9,14 +9,15 @@ from argilla_plugins.programmatic_labelling import *
 from argilla_plugins.reporting import *
 from argilla_plugins.utils.cli_tools import app
 
-app.command(end_of_life)
-
 
 __all__ = [
     "end_of_life",
     "classy_learner",
     "token_copycat",
     "embedder",
+    "predictor",
+    "datapane_report",
+    "great_expectations_report",
     "programmatic_labelling",
 ]
 
@@ -5,11 +5,13 @@ from argilla import listener
 
 from argilla_plugins.utils.cli_tools import app
 from argilla_plugins.utils.dependency_checker import import_package
+from argilla_plugins.utils.profiling import profiled
 
 
 def template(
     name: str,
     query: str = None,
+    profile=None,
     *args,  # note that *args and **kwargs are forwarded to the listener
     **kwargs,
 ):
@@ -19,6 +21,8 @@ def template(
     Args:
         name (str): str, the name of the dataset to which the plugin will be applied.
         query (str): a query string to filter the records that will be deleted.
+        profile (Union[str, Profiler]): a `Profiler`, or a directory, to profile the first runs of the plugin
+            with cProfile. Defaults to None, the `--profile` CLI option if given.
 
     Returns:
         __output__
@@ -38,6 +42,7 @@ def template(
         *args,
         **kwargs,
     )
+    @profiled(profile, f"template-{name}")
     def plugin(records, ctx):
         log.info("hello world")
 
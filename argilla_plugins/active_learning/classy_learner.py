@@ -1,10 +1,98 @@
+import copy
+import functools
 import logging
-from collections import Counter
+from typing import Callable, List, Optional
 
 import argilla as rg
+import numpy as np
 from argilla import listener
 
+from argilla_plugins.active_learning.hot_swap import HotSwapModel
+from argilla_plugins.active_learning.sampling import LabelReservoir, k_center
 from argilla_plugins.utils.dependency_checker import import_package
+from argilla_plugins.utils.memory import deep_sizeof, parse_memory_budget
+from argilla_plugins.utils.profiling import profiled
+from argilla_plugins.utils.records import RecordBatch, load_records, with_fields
+from argilla_plugins.utils.state_store import get_state_store
+
+_FIELDS = ["text", "annotation", "event_timestamp"]
+
+
+def _most_recent(n_per_label: int, reverse: bool) -> Callable[[RecordBatch], List]:
+    """Select the first `n_per_label` records per label in `event_timestamp` order."""
+
+    def select(batch: RecordBatch) -> List:
+        order = batch.argsort("event_timestamp", reverse=reverse)
+        selected = np.zeros(len(batch), dtype=bool)
+        for col in range(len(batch.labels)):
+            rows = order[batch.annotation_matrix[order, col]]
+            selected[rows[:n_per_label]] = True
+        # keep id order, so ties are broken as in a full load
+        return [batch.records[row] for row in np.flatnonzero(selected)]
+
+    return select
+
+
+def _reservoir(size: int, seed: int) -> Callable[[RecordBatch], List]:
+    """Select a `LabelReservoir` of `size` records per label."""
+
+    def select(batch: RecordBatch) -> List:
+        kept = {rec.id for rec in LabelReservoir(size, seed=seed).update(batch.records).records()}
+        return [rec for rec in batch.records if rec.id in kept]
+
+    return select
+
+
+def _with_sample(
+    select: Callable[[RecordBatch], List],
+    memory_budget: Optional[int],
+    log: logging.Logger,
+) -> Callable:
+    """
+    Like `with_fields(_FIELDS, as_batch=True)`, but the annotated records are streamed in pages and only the
+    records chosen by `select` are kept. As long as `select` of the kept records and a new page equals `select`
+    of all records seen so far, the body receives the same training samples as with a full load.
+    The page size, kept in `ctx.query_params["page_size"]`, is reduced when a page exceeds `memory_budget`.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            if len(args) != 1:
+                return func(*args)
+            ctx = args[0]
+            kept, id_from = [], None
+            while True:
+                page_size = ctx.query_params["page_size"]
+                page = load_records(
+                    ctx.__listener__.dataset,
+                    _FIELDS,
+                    query=ctx.query,
+                    limit=page_size,
+                    id_from=id_from,
+                )
+                batch = RecordBatch.from_records(kept + page)
+                kept = select(batch)
+                if memory_budget:
+                    footprint = deep_sizeof(batch)
+                    if footprint > memory_budget:
+                        ctx.query_params["page_size"] = max(
+                            1, len(page) * memory_budget // footprint
+                        )
+                        log.info(f"reduced page size to {ctx.query_params['page_size']}")
+                if len(page) < page_size:
+                    break
+                id_from = page[-1].id
+            if memory_budget:
+                log.info(
+                    f"memory footprint {footprint} of {memory_budget} bytes,"
+                    f" kept {len(kept)} training samples"
+                )
+            return func(RecordBatch.from_records(kept), ctx)
+
+        return wrapper
+
+    return decorator
 
 
 def classy_learner(
@@ -18,12 +106,21 @@ def classy_learner(
     min_n_samples: int = 8,
     max_n_samples=20,
     batch_size=1000,
+    balance_classes: bool = False,
+    reservoir_size: int = None,
+    seed: int = 0,
+    state_store=None,
+    memory_budget=None,
+    profile=None,
     *args,
     **kwargs,
 ):
     """
     This plugin uses the `classy-classification` package to train a model on a dataset using an active learning loop.
 
+    The classifier is fitted on a background thread, while the previous version keeps predicting. A new version is
+    swapped in atomically once fitted, together with its version `idx`.
+
     Args:
         name (str): str, the name of the dataset to which the plugin will be applied.
         query (str): a query string to filter the records that will be considered for updating .
@@ -34,9 +131,25 @@ def classy_learner(
         sample_strategy (str, optional): Methods for organizing training data samples.
             "fifo" - first in first out for using the most recent data.
             "lifo" - last in first out for using the earliest annotated data.
+            "diverse" - a reservoir sample per label, of which the `max_n_samples` most diverse records in embedding
+            space are selected with k-center. The embeddings come from the current classifier, the first version is
+            fitted on the most recent samples.
             Defaults to "fifo".
-        min_n_samples (int, optional): Minimum number of data samples per class to start inference. Defaults to 6.
-        max_n_samples (int, optional): Maximum nunmber of data samples per class to use during inference. Defaults to 20.
+        min_n_samples (int, optional): Minimum number of data samples per class to start inference. Defaults to 8.
+        max_n_samples (int, optional): Maximum number of data samples per class to use during inference. Defaults to 20.
+        balance_classes (bool, optional): If True, every class is fitted on as many samples as the smallest class.
+            Defaults to False.
+        reservoir_size (int, optional): The number of records per label sampled for the "diverse" strategy.
+            Defaults to 5 times `max_n_samples`.
+        seed (int, optional): The seed of the reservoir sample. Defaults to 0.
+        state_store (Union[str, StateStore], optional): A state store, or a path to one, used to persist the training
+            data, the classifier and its version so a restarted listener does not re-fit. Defaults to None.
+
+        memory_budget (Union[int, str], optional): The memory budget for loading annotated records, e.g. "256MB".
+            Records are streamed in pages and only the samples used for training are kept. Defaults to None,
+            load all annotated records at once.
+        profile (Union[str, Profiler]): a `Profiler`, or a directory, to profile the first runs of the plugin
+            with cProfile. Defaults to None, the `--profile` CLI option if given.
     """
     import_package("classy_classification")
     log = logging.getLogger(f"classy_learner | {name}")
@@ -47,8 +160,13 @@ def classy_learner(
     assert min_n_samples <= max_n_samples, ValueError(
         "`min_n_samples` must be less than or equal to `max_n_samples`"
     )
-    assert sample_strategy in ["fifo", "lifo"], ValueError(
-        "`sample_strategy` must be either 'fifo' or 'lifo'"
+    assert sample_strategy in ["fifo", "lifo", "diverse"], ValueError(
+        "`sample_strategy` must be either 'fifo', 'lifo' or 'diverse'"
+    )
+    if reservoir_size is None:
+        reservoir_size = 5 * max_n_samples
+    assert reservoir_size >= max_n_samples, ValueError(
+        "`reservoir_size` must be greater than or equal to `max_n_samples`"
     )
     assert certainty_threshold >= 0 and certainty_threshold <= 1, ValueError(
         "`certainty_threshold` must be between 0 and 1"
@@ -59,70 +177,127 @@ def classy_learner(
     else:
         query = f"({query}) AND NOT annotated_as: *"
 
+    state_store = get_state_store(state_store)
+    state_key = f"classy_learner/{name}"
+    state = state_store.load(state_key) if state_store else {}
+    if state:
+        log.info(f"resuming classifier version {state['idx']} from {state_key}")
+
+    memory_budget = parse_memory_budget(memory_budget)
+    if sample_strategy == "diverse":
+        load = _with_sample(
+            _reservoir(reservoir_size, seed), memory_budget=memory_budget, log=log
+        )
+    elif memory_budget is None:
+        load = with_fields(_FIELDS, as_batch=True)
+    else:
+        load = _with_sample(
+            _most_recent(max_n_samples, reverse=sample_strategy == "lifo"),
+            memory_budget=memory_budget,
+            log=log,
+        )
+
+    # embeddings of the sampled texts, so only new samples are encoded on every run
+    embeddings = {}
+
+    def select_diverse(classy_classifier, texts: np.ndarray, n: int) -> List[str]:
+        # texts are embedded by the sentence-transformer of the serving classifier, so before there is
+        # one the first version is fitted on the most recent samples of the reservoir
+        if classy_classifier is None:
+            return list(texts[:n])
+        new_texts = [text for text in set(texts) if text not in embeddings]
+        if new_texts:
+            embeddings.update(zip(new_texts, classy_classifier.get_embeddings(new_texts)))
+        picks = k_center(np.array([embeddings[text] for text in texts]), n)
+        return list(texts[picks])
+
+    def save_state(classy_classifier, idx, data):
+        if state_store:
+            state_store.save(
+                state_key,
+                {"data": data, "classy_classifier": classy_classifier, "idx": idx},
+            )
+
+    def fit(classy_classifier, data, multi_label):
+        log.info("Fitting classifier on new data...")
+        if classy_classifier is None or classy_classifier.multi_label != multi_label:
+            return ClassyClassifier(
+                model=model,
+                data=data,
+                multi_label=multi_label,
+                config=classy_config,
+                verbose=False,
+            )
+        # the serving classifier keeps predicting, so the new version is fitted on a shallow copy that shares
+        # its sentence-transformer, refitting only sets new training data and a new sklearn head
+        classy_classifier = copy.copy(classy_classifier)
+        classy_classifier.set_training_data(data=data)
+        return classy_classifier
+
+    hot_swap = HotSwapModel(
+        model=state.get("classy_classifier"),
+        idx=state.get("idx", 0),
+        data=state.get("data", {}),
+        on_swap=save_state,
+        name=f"classy_learner-{name}",
+    )
+
     @listener(
         dataset=name,
         query="annotated_as: *",
+        with_records=False,
         *args,
         **kwargs,
-        data={},
-        classy_classifier=None,
-        idx=0,
+        classy_classifier=hot_swap,
+        page_size=batch_size,
     )
+    @profiled(profile, f"classy_learner-{name}")
+    @load
     def plugin(records, ctx):
-        if records:
+        if len(records):
             # sort records by event_timestamp
-            if sample_strategy == "fifo":
-                records = sorted(records, key=lambda x: x.event_timestamp)
-            elif sample_strategy == "lifo":
-                records = sorted(records, key=lambda x: x.event_timestamp, reverse=True)
-
-            # prepare data for classy-classification
-            if records[0].multi_label:
-                annotations = [
-                    [annotation for annotation in rec.annotation] for rec in records
-                ]
-                texts = [[rec.text for _ in rec.annotation] for rec in records]
-                multi_label = True
-            else:
-                annotations = [rec.annotation for rec in records]
-                texts = [rec.text for rec in records]
-                multi_label = False
+            records = records.take(
+                records.argsort("event_timestamp", reverse=sample_strategy == "lifo")
+            )
+            multi_label = records.multi_label
 
             # check all values in counter are larger than min_n_samples
-            counter = dict(Counter(annotations))
+            counter = {
+                label: count
+                for label, count in records.label_counts().items()
+                if count
+            }
             if all([v >= min_n_samples for v in counter.values()]):
+                n_samples = max_n_samples
+                if balance_classes:
+                    n_samples = min([n_samples, *counter.values()])
+                hot_swap = ctx.query_params["classy_classifier"]
                 # format data for classy-classification
                 data = {}
-                for key in counter.keys():
-                    data[key] = []
-                for key, value in zip(annotations, texts):
-                    if len(data[key]) <= max_n_samples:
-                        data[key].append(value)
-                # re-initialize classifier if there is new data
-                if ctx.query_params["data"] == data:
-                    classy_classifier = ctx.query_params["classy_classifier"]
-                else:
-                    log.info("Fitting classifier on new data...")
-                    if ctx.query_params["classy_classifier"] is None:
-                        classy_classifier = ClassyClassifier(
-                            model=model,
-                            data=data,
-                            multi_label=multi_label,
-                            config=classy_config,
-                            verbose=False,
-                        )
+                for col, key in enumerate(records.labels):
+                    if key not in counter:
+                        continue
+                    texts = records.text[records.annotation_matrix[:, col]]
+                    if sample_strategy == "diverse":
+                        data[key] = select_diverse(hot_swap.current[0], texts, n_samples)
                     else:
-                        # update version idx when new data is added
-                        ctx.query_params["idx"] = ctx.query_params["idx"] + 1
-                        classy_classifier = ctx.query_params["classy_classifier"]
-                        classy_classifier.set_training_data(data=data)
-
-                ctx.query_params["data"] = data
-                ctx.query_params["classy_classifier"] = classy_classifier
+                        data[key] = list(texts[:n_samples])
+                if sample_strategy == "diverse":
+                    for text in set(embeddings) - set(records.text):
+                        del embeddings[text]
+                # train a new version in the background if there is new data,
+                # the current version keeps predicting until it is swapped in
+                hot_swap.submit(
+                    data, lambda classifier, data: fit(classifier, data, multi_label)
+                )
+                classy_classifier, idx = hot_swap.current
+                if classy_classifier is None:
+                    log.info("waiting for the first classifier to be fitted")
+                    return
 
                 relevant_batch_query = (
                     f"({query}) AND ((metadata.idx:"
-                    f" {ctx.query_params['idx']}) OR (NOT"
+                    f" {idx}) OR (NOT"
                     " metadata.idx: *))"
                 )
                 records_new = rg.load(
@@ -132,39 +307,27 @@ def classy_learner(
                 )
 
                 if records_new:
-                    updated_records = []
                     texts = [rec.text for rec in records_new]
                     predictions = classy_classifier.pipe(texts)
 
-                    for rec, pred in zip(records_new, predictions):
-                        max_new_pred = pred[max(pred, key=pred.get)]
-                        max_old_pred = 0
+                    # compare new and old predictions column-wise
+                    batch_new = RecordBatch.from_records(records_new)
+                    max_new_pred = np.array([max(pred.values()) for pred in predictions])
+                    max_old_pred = batch_new.max_scores()
+                    # only overwrite if allowed and the new pred is more certain than previous
+                    compare_old = ~np.isnan(max_old_pred) & overwrite_predictions
+                    update = (max_new_pred > certainty_threshold) & (
+                        ~compare_old | (max_new_pred > np.nan_to_num(max_old_pred))
+                    )
 
+                    updated_records = []
+                    for row in np.flatnonzero(update):
+                        rec = records_new[row]
                         # format as list of tuples expected by Argilla
-                        pred = [(k, v) for k, v in pred.items()]
-
-                        # only overwrite if allowed
-                        if rec.prediction and overwrite_predictions:
-                            max_old_pred = dict(rec.prediction)[
-                                max(dict(rec.prediction), key=dict(rec.prediction).get)
-                            ]
-                            if (
-                                max_new_pred > certainty_threshold
-                            ) and (  # pred is certain enough
-                                max_new_pred > max_old_pred
-                            ):  # new pred is more certain than previous
-                                rec.prediction = pred
-                                updated_records.append(rec)
-                        else:
-                            # only add prediction if it is certain enough
-                            if max_new_pred > certainty_threshold:
-                                # Logging the records to the dataset.
-                                rec.prediction = pred
-                                updated_records.append(rec)
-
-                    # update idx for record
-                    for rec in updated_records:
-                        rec.metadata["idx"] = ctx.query_params["idx"]
+                        rec.prediction = [(k, v) for k, v in predictions[row].items()]
+                        # update idx for record
+                        rec.metadata["idx"] = idx
+                        updated_records.append(rec)
 
                     # log data for updated records
                     if updated_records:
@@ -182,6 +345,15 @@ def classy_learner(
         else:
             log.info("waiting for annotations")
 
+    stop = plugin.stop
+
+    def stop_training():
+        stop()
+        hot_swap.shutdown(wait=False)
+
+    # a stopped listener also stops its training thread
+    plugin.stop = stop_training
+
     log.info(f"created an classy_learner listener with {query}")
 
     return plugin
@@ -0,0 +1,109 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+
+class HotSwapModel:
+    """
+    Serve a model version while the next version trains on a background thread.
+
+    A new version is trained by `fit(current_model, data)`. It must return a new model and leave the current one
+    untouched, since the current one keeps serving predictions while the new one trains. When training finishes,
+    the model, its version `idx` and its training data are swapped in as a single tuple, so `current` never
+    returns a model with the version of another. The version is bumped on every swap except the first model.
+
+    Deep copies return the same instance, so it can be kept in the query params of a listener with a `condition`.
+    Call `shutdown` to stop the training thread, a later `submit` starts a new one.
+
+    Args:
+        model (Any): the model to serve until a new version is trained. Defaults to None, no model yet.
+        idx (int): the version of `model`. Defaults to 0.
+        data (Any): the training data of `model`. Defaults to None.
+        on_swap (Callable): called with the model, its version and its training data after every swap,
+            e.g. to persist them. Defaults to None.
+        name (str): the name used for the training thread and logs. Defaults to "model".
+    """
+
+    def __init__(
+        self,
+        model: Any = None,
+        idx: int = 0,
+        data: Any = None,
+        on_swap: Callable[[Any, int, Any], None] = None,
+        name: str = "model",
+    ):
+        self.on_swap = on_swap
+        self._log = logging.getLogger(f"hot_swap | {name}")
+        self._lock = threading.Lock()
+        self._current = (model, idx, data)
+        # the training data of the serving version, or of the version in training
+        self._target = data
+        self._future: Optional[Future] = None
+        self._name = name
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __deepcopy__(self, memo: dict) -> "HotSwapModel":
+        # the serving model and training thread are shared, not copied
+        return self
+
+    @property
+    def current(self) -> Tuple[Any, int]:
+        """The serving model and its version."""
+        with self._lock:
+            model, idx, _ = self._current
+        return model, idx
+
+    @property
+    def training(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def submit(self, data: Any, fit: Callable[[Any, Any], Any]) -> bool:
+        """
+        Start training a new version on `data` in the background.
+
+        Nothing is trained while another version is training, or when `data` is the training data of the serving
+        or training version. Call it again on a later run to train on data that changed meanwhile.
+
+        Returns:
+            Whether a new version started training.
+        """
+        with self._lock:
+            if self.training or data == self._target:
+                return False
+            self._target = data
+            model = self._current[0]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"train-{self._name}"
+                )
+            self._future = self._executor.submit(self._train, fit, model, data)
+        return True
+
+    def _train(self, fit: Callable[[Any, Any], Any], model: Any, data: Any):
+        try:
+            new_model = fit(model, data)
+        except Exception:
+            self._log.exception("training failed, keep serving the current version")
+            with self._lock:
+                self._target = self._current[2]
+            return
+        with self._lock:
+            old_model, idx, _ = self._current
+            self._current = (new_model, idx if old_model is None else idx + 1, data)
+            current = self._current
+        self._log.info(f"swapped in version {current[1]}")
+        if self.on_swap is not None:
+            self.on_swap(*current)
+
+    def wait(self, timeout: float = None):
+        """Wait for the version in training, if any."""
+        if self._future is not None:
+            self._future.result(timeout=timeout)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the training thread, waiting for the version in training if `wait`."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,97 @@
+import hashlib
+import heapq
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from argilla_plugins.utils.records import get_labels
+
+
+class LabelReservoir:
+    """
+    A reservoir of at most `size` annotated records per label.
+
+    Records are ranked by a seeded hash of their id and every label keeps the lowest ranked ones, a bottom-k
+    sample. This is a uniform sample without replacement that does not depend on the order in which records
+    are added, so reservoirs of pages can be merged and a listener that reloads the dataset on every run keeps
+    the same samples, only replacing them when new annotations rank lower.
+
+    Multi-label records are added to the reservoir of each of their labels.
+
+    Args:
+        size (int): the maximum number of records per label.
+        seed (int): the seed of the ranking hash. Defaults to 0.
+    """
+
+    def __init__(self, size: int, seed: int = 0):
+        assert size > 0, ValueError("`size` must be positive")
+        self.size = size
+        self.seed = seed
+        self._heaps: Dict[Any, list] = defaultdict(list)
+
+    def _rank(self, rec_id: Any) -> int:
+        digest = hashlib.blake2b(f"{self.seed}:{rec_id}".encode("utf-8"), digest_size=8)
+        return int.from_bytes(digest.digest(), "big")
+
+    def add(self, rec: Any):
+        """Add an annotated record, records without annotation are ignored."""
+        labels = get_labels(rec.annotation)
+        if not labels:
+            return
+        # a max-heap on the rank, the string id breaks ties without comparing records
+        item = (-self._rank(rec.id), str(rec.id), rec)
+        for label in set(labels):
+            heap = self._heaps[label]
+            if len(heap) < self.size:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    def update(self, records: Iterable[Any]) -> "LabelReservoir":
+        for rec in records:
+            self.add(rec)
+        return self
+
+    @property
+    def labels(self) -> List[Any]:
+        return sorted(self._heaps, key=str)
+
+    def sample(self, label: Any) -> List[Any]:
+        """The sampled records of a label, ordered by rank."""
+        return [rec for _, _, rec in sorted(self._heaps[label], reverse=True)]
+
+    def records(self) -> List[Any]:
+        """The sampled records of all labels, without duplicates."""
+        records = {}
+        for heap in self._heaps.values():
+            for _, rec_id, rec in heap:
+                records[rec_id] = rec
+        return list(records.values())
+
+
+def k_center(embeddings: np.ndarray, k: int) -> np.ndarray:
+    """
+    Greedy k-center selection: start from the point closest to the centroid and repeatedly add the point
+    farthest from the points selected so far, so the selection covers the embedding space.
+
+    Args:
+        embeddings (np.ndarray): the embeddings (points x dimensions), compared by cosine distance.
+        k (int): the number of points to select.
+
+    Returns:
+        The indices of the selected points, in order of selection.
+    """
+    points = np.asarray(embeddings, dtype=float)
+    if k >= len(points):
+        return np.arange(len(points))
+    norms = np.linalg.norm(points, axis=1, keepdims=True)
+    points = points / np.where(norms == 0, 1, norms)
+
+    selected = [int(np.argmin(np.linalg.norm(points - points.mean(axis=0), axis=1)))]
+    distances = np.linalg.norm(points - points[selected[0]], axis=1)
+    while len(selected) < k:
+        idx = int(np.argmax(distances))
+        selected.append(idx)
+        distances = np.minimum(distances, np.linalg.norm(points - points[idx], axis=1))
+    return np.array(selected)
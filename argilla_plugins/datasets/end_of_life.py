@@ -4,15 +4,18 @@ import logging
 import argilla as rg
 from argilla import listener
 
-from argilla_plugins.utils.cli_tools import app
+from argilla_plugins.utils.cli_tools import command
+from argilla_plugins.utils.profiling import profiled
+from argilla_plugins.utils.records import with_fields
 
 
-@app.command()
+@command()
 def end_of_life(
     name: str,
     query: str = None,
     end_of_life_in_seconds: int = None,
     discard_only: bool = False,
+    profile=None,
     *args,
     **kwargs,
 ):
@@ -25,6 +28,8 @@ def end_of_life(
       end_of_life_in_seconds (int): the number of seconds after which the data will be deleted.
       discard_only (bool): if True, the records will be marked as deleted, but not actually deleted.
     Defaults to False
+      profile (Union[str, Profiler]): a `Profiler`, or a directory, to profile the first runs of the plugin
+          with cProfile. Defaults to None, the `--profile` CLI option if given.
 
     Returns:
       A function that takes in records and ctx and deletes the records.
@@ -65,8 +70,11 @@ def end_of_life(
         query=query,
         *args,
         **kwargs,
+        with_records=False,
         end_of_life_date_seconds=start_end_of_life_date_seconds,
     )
+    @profiled(profile, f"end_of_life-{name}")
+    @with_fields(["id"])
     def plugin(records, ctx):
         # delete records
         ids = [rec.id for rec in records]
@@ -3,14 +3,18 @@ import logging
 import argilla as ar
 from argilla import listener
 
-from argilla_plugins.utils.cli_tools import app
+from argilla_plugins.utils.cli_tools import command
+from argilla_plugins.utils.profiling import profiled
+from argilla_plugins.utils.records import with_fields
 
 
-@app.command()
+@command(exclude=["sharding"])
 def remove_duplicate(
     name: str,
     query: str = None,
     discard_only: bool = False,
+    sharding=None,
+    profile=None,
     *args,
     **kwargs,
 ):
@@ -22,6 +26,11 @@ def remove_duplicate(
       query (str): a query string to filter the records that will be deleted.
       discard_only (bool): if True, the records will be marked as deleted, but not actually deleted.
     Defaults to False
+      sharding (ShardCoordinator): split the records over workers by a hash of their text, so duplicates always
+    end up in the same shard. Every worker still fetches the ids and texts of all records, only the
+    duplicate detection and deletion are sharded. Defaults to None
+      profile (Union[str, Profiler]): a `Profiler`, or a directory, to profile the first runs of the plugin
+          with cProfile. Defaults to None, the `--profile` CLI option if given.
 
     Returns:
       A function that takes in records and ctx and deletes the records.
@@ -38,11 +47,20 @@ def remove_duplicate(
     @listener(
         dataset=name,
         query=query,
-        condition=lambda search: search.total > 2
+        condition=lambda search: search.total > 2,
+        with_records=False,
         *args,
         **kwargs,
     )
+    @profiled(profile, f"remove_duplicate-{name}")
+    @with_fields(["id", "text"])
     def plugin(records, ctx):
+        if sharding is not None:
+            if sharding.acquire() is None:
+                log.info("no free shard, waiting")
+                return
+            records = sharding.filter(records, key=lambda rec: rec.text)
+
         duplicated_ids = set()
         known_texts = set()
         for rec in records:
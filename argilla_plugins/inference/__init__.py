@@ -1,3 +1,4 @@
 from argilla_plugins.inference.embedder import embedder
+from argilla_plugins.inference.predictor import predictor
 
-__all__ = ["embedder"]
+__all__ = ["embedder", "predictor"]
@@ -4,6 +4,10 @@ import argilla as rg
 from argilla import listener
 
 from argilla_plugins.utils.dependency_checker import import_package
+from argilla_plugins.utils.memory import deep_sizeof, parse_memory_budget
+from argilla_plugins.utils.profiling import profiled
+from argilla_plugins.utils.records import load_page
+from argilla_plugins.utils.state_store import get_state_store
 
 
 def embedder(
@@ -14,6 +18,10 @@ def embedder(
     device="cpu",
     batch_size=32,
     chunk_size=1000,
+    state_store=None,
+    sharding=None,
+    memory_budget=None,
+    profile=None,
     *args,
     **kwargs,
 ):
@@ -39,24 +47,81 @@ def embedder(
     else:
         query = f"({query}) AND NOT vectors.{vector_name}: *"
 
+    # vectors are checkpointed before a chunk is logged, so a restart does not encode them again
+    state_store = get_state_store(state_store)
+    state_key = f"embedder/{name}"
+    state = state_store.load(state_key) if state_store else {}
+    if state.get("pending"):
+        log.info(f"resuming {len(state['pending'])} encoded records from {state_key}")
+
+    # records are streamed in pages of at most `chunk_size`, smaller when a page exceeds the memory budget
+    memory_budget = parse_memory_budget(memory_budget)
+
     @listener(
         dataset=name,
         query=query,
+        with_records=False,
         *args,
         **kwargs,
+        pending=state.get("pending", {}),
+        page_size=chunk_size,
     )
-    def plugin(records, ctx):
-        record_chunks = [
-            records[i : i + chunk_size] for i in range(0, len(records), chunk_size)
-        ]
-        for chunk in record_chunks:
-            texts = [record.text for record in chunk]
-            embeddings = sentence_transformer.encode(texts, batch_size=batch_size)
-            for record, vector in zip(chunk, embeddings):
+    @profiled(profile, f"embedder-{name}")
+    def plugin(ctx):
+        if sharding is not None and sharding.acquire() is None:
+            log.info("no free shard, waiting")
+            return
+
+        pending = ctx.query_params["pending"]
+        id_from = None
+        while True:
+            # a long run renews the lease on every page, and stops when the shard was taken over
+            if sharding is not None and id_from is not None and not sharding.renew():
+                log.info("lost the lease of the shard, stopping")
+                return
+            chunk, id_from = load_page(
+                ctx.__listener__.dataset,
+                query=ctx.query,
+                limit=ctx.query_params["page_size"],
+                id_from=id_from,
+                keep=sharding.owns if sharding is not None else None,
+            )
+            to_encode = [record for record in chunk if record.id not in pending]
+            if to_encode:
+                texts = [record.text for record in to_encode]
+                embeddings = sentence_transformer.encode(texts, batch_size=batch_size)
+                for record, vector in zip(to_encode, embeddings):
+                    pending[record.id] = [float(num) for num in vector.tolist()]
+                if state_store:
+                    state_store.save(state_key, {"pending": pending})
+            for record in chunk:
                 if record.vectors is None:
                     record.vectors = {}
-                record.vectors[vector_name] = [float(num) for num in vector.tolist()]
-            log.info(f"logging {len(chunk)} records")
-            rg.log(chunk, name=ctx.__listener__.dataset)
+                record.vectors[vector_name] = pending[record.id]
+
+            if chunk and memory_budget:
+                footprint = deep_sizeof(chunk) + deep_sizeof(pending)
+                log.info(f"memory footprint {footprint} of {memory_budget} bytes")
+                if footprint > memory_budget:
+                    ctx.query_params["page_size"] = max(
+                        1, len(chunk) * memory_budget // footprint
+                    )
+                    log.info(f"reduced page size to {ctx.query_params['page_size']}")
+
+            if chunk:
+                log.info(f"logging {len(chunk)} records")
+                rg.log(chunk, name=ctx.__listener__.dataset)
+            for record in chunk:
+                del pending[record.id]
+            if state_store and chunk:
+                state_store.save(state_key, {"pending": pending})
+            if id_from is None:
+                break
+
+        # drop vectors of records that were logged before a restart but not checkpointed
+        if pending:
+            pending.clear()
+            if state_store:
+                state_store.save(state_key, {"pending": pending})
 
     return plugin
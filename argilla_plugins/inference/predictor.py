@@ -0,0 +1,250 @@
+import logging
+import time
+from typing import Any, Callable, List
+
+import argilla as rg
+from argilla import listener
+
+from argilla_plugins.programmatic_labelling.token_copycat import token_offsets
+from argilla_plugins.utils.dependency_checker import import_package
+from argilla_plugins.utils.memory import deep_sizeof, parse_memory_budget
+from argilla_plugins.utils.profiling import profiled
+from argilla_plugins.utils.records import load_page
+
+
+class DynamicBatcher:
+    """
+    Run a batched function over texts with dynamic batching.
+
+    Texts are sorted by length so batches need little padding, and the batch size is halved when a
+    batch takes longer than `max_latency_in_seconds` and doubled, up to `max_batch_size`, when it takes
+    less than half of it.
+
+    Args:
+        max_batch_size (int): the maximum number of texts per batch.
+        max_latency_in_seconds (float): the latency budget per batch. Defaults to None, no budget.
+    """
+
+    def __init__(self, max_batch_size: int, max_latency_in_seconds: float = None):
+        self.max_batch_size = max_batch_size
+        self.max_latency_in_seconds = max_latency_in_seconds
+        self.batch_size = max_batch_size
+
+    def _adapt(self, seconds: float):
+        if self.max_latency_in_seconds is None:
+            return
+        if seconds > self.max_latency_in_seconds:
+            self.batch_size = max(1, self.batch_size // 2)
+        elif seconds < self.max_latency_in_seconds / 2:
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+    def __call__(self, func: Callable[[List[str]], List[Any]], texts: List[str]) -> List[Any]:
+        order = sorted(range(len(texts)), key=lambda idx: len(texts[idx]))
+        outputs = [None] * len(texts)
+        start = 0
+        while start < len(order):
+            indices = order[start : start + self.batch_size]
+            tic = time.perf_counter()
+            batch_outputs = func([texts[idx] for idx in indices])
+            self._adapt(time.perf_counter() - tic)
+            for idx, output in zip(indices, batch_outputs):
+                outputs[idx] = output
+            start += len(indices)
+        return outputs
+
+
+def _load_onnx_model(model: str, task: str, quantize: bool = False):
+    """Load an ONNX model exported with `optimum`, None if `optimum` is not installed or `model` has no ONNX export."""
+    log = logging.getLogger(f"predictor | {model}")
+    try:
+        from optimum.onnxruntime import (
+            ORTModelForSequenceClassification,
+            ORTModelForTokenClassification,
+        )
+    except ImportError:
+        return None
+
+    model_class = {
+        "text-classification": ORTModelForSequenceClassification,
+        "token-classification": ORTModelForTokenClassification,
+    }[task]
+    try:
+        loaded_model = model_class.from_pretrained(model)
+    except OSError as error:
+        # raised when the model files contain no ONNX export
+        log.info(f"no ONNX export found, loading the model with `transformers`: {error}")
+        return None
+    if quantize:
+        log.warning(
+            "`quantize` is not applied to ONNX models, export a quantized model with"
+            " `optimum.onnxruntime.ORTQuantizer` instead"
+        )
+    return loaded_model
+
+
+def load_pipeline(model: str, task: str, device: str = "cpu", quantize: bool = False):
+    """
+    Load a `transformers` pipeline, optionally with int8 dynamic quantization of its linear layers.
+    ONNX models exported with `optimum` are loaded with `onnxruntime` when `optimum` is installed, these
+    are not quantized.
+    """
+    import_package("transformers")
+    from transformers import AutoTokenizer, pipeline
+
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    loaded_model = _load_onnx_model(model, task, quantize=quantize)
+    if loaded_model is None:
+        from transformers import (
+            AutoModelForSequenceClassification,
+            AutoModelForTokenClassification,
+        )
+
+        model_class = {
+            "text-classification": AutoModelForSequenceClassification,
+            "token-classification": AutoModelForTokenClassification,
+        }[task]
+        loaded_model = model_class.from_pretrained(model)
+        if quantize:
+            import torch
+
+            loaded_model = torch.quantization.quantize_dynamic(
+                loaded_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+    if task == "text-classification":
+        return pipeline(
+            task, model=loaded_model, tokenizer=tokenizer, device=device, top_k=None
+        )
+    return pipeline(
+        task,
+        model=loaded_model,
+        tokenizer=tokenizer,
+        device=device,
+        aggregation_strategy="simple",
+    )
+
+
+def predictor(
+    name: str,
+    query: str = None,
+    model: str = "distilbert-base-uncased-finetuned-sst-2-english",
+    task: str = "text-classification",
+    device: str = "cpu",
+    quantize: bool = False,
+    batch_size: int = 32,
+    max_latency_in_seconds: float = None,
+    chunk_size: int = 1000,
+    overwrite_predictions: bool = False,
+    memory_budget=None,
+    profile=None,
+    *args,
+    **kwargs,
+):
+    """
+    It creates a listener that runs a local `transformers` text or token classification model over
+    unlabelled records and logs its predictions.
+
+    Args:
+        name (str): the name of the dataset to which the plugin will be applied.
+        query (str): a query string to filter the records that will be predicted.
+        model (str): the model name or path. Defaults to "distilbert-base-uncased-finetuned-sst-2-english".
+        task (str): "text-classification" or "token-classification". Defaults to "text-classification".
+        device (str): the device to run the model on. Defaults to "cpu".
+        quantize (bool): if True, the linear layers are quantized to int8 for faster CPU inference. Defaults to False.
+        batch_size (int): the maximum number of texts per model batch. Defaults to 32.
+        max_latency_in_seconds (float): the latency budget per batch, the batch size is adapted to it.
+            Defaults to None, no budget.
+        chunk_size (int): the number of records predicted and logged at once. Defaults to 1000.
+        overwrite_predictions (bool): if True, records with predictions of other models are predicted again.
+            Records already predicted by `model` are skipped. Defaults to False.
+        memory_budget (Union[int, str]): the memory budget of a chunk of records, e.g. "512MB". Records are
+            streamed in chunks and the chunk size is reduced when a chunk exceeds it. Defaults to None, no budget.
+        profile (Union[str, Profiler]): a `Profiler`, or a directory, to profile the first runs of the plugin
+            with cProfile. Defaults to None, the `--profile` CLI option if given.
+
+    Returns:
+        A listener that adds predictions to the records.
+    """
+    log = logging.getLogger(f"predictor | {name}")
+
+    assert task in ["text-classification", "token-classification"], ValueError(
+        "`task` must be either 'text-classification' or 'token-classification'"
+    )
+    assert batch_size > 0, ValueError("`batch_size` must be positive")
+    assert chunk_size > 0, ValueError("`chunk_size` must be positive")
+
+    pipe = load_pipeline(model, task, device=device, quantize=quantize)
+    batcher = DynamicBatcher(batch_size, max_latency_in_seconds=max_latency_in_seconds)
+
+    def predict(texts: List[str]) -> List[Any]:
+        return pipe(texts, batch_size=len(texts))
+
+    def to_prediction(rec: Any, output: List[dict]) -> list:
+        if task == "text-classification":
+            return [(pred["label"], float(pred["score"])) for pred in output]
+        # only keep entities aligned with the record tokens
+        starts, ends = token_offsets(rec.text, rec.tokens)
+        starts, ends = set(starts), set(ends)
+        return [
+            (ent["entity_group"], ent["start"], ent["end"], float(ent["score"]))
+            for ent in output
+            if ent["start"] in starts and ent["end"] in ends
+        ]
+
+    query_parts = ["NOT annotated_as: *"]
+    if overwrite_predictions:
+        # records predicted by this model are not predicted again on every run
+        query_parts.append(f'NOT predicted_by: "{model}"')
+    else:
+        query_parts.append("NOT predicted_as: *")
+    if query:
+        query_parts.insert(0, f"({query})")
+    query = " AND ".join(query_parts)
+
+    memory_budget = parse_memory_budget(memory_budget)
+
+    @listener(
+        dataset=name,
+        query=query,
+        with_records=False,
+        *args,
+        **kwargs,
+        page_size=chunk_size,
+    )
+    @profiled(profile, f"predictor-{name}")
+    def plugin(ctx):
+        id_from = None
+        while True:
+            chunk, id_from = load_page(
+                ctx.__listener__.dataset,
+                query=ctx.query,
+                limit=ctx.query_params["page_size"],
+                id_from=id_from,
+            )
+            if chunk:
+                tic = time.perf_counter()
+                outputs = batcher(predict, [rec.text for rec in chunk])
+                seconds = time.perf_counter() - tic
+                for rec, output in zip(chunk, outputs):
+                    rec.prediction = to_prediction(rec, output)
+                    rec.prediction_agent = model
+                log.info(
+                    f"logging {len(chunk)} records, predicted at"
+                    f" {len(chunk) / seconds:.1f} records/sec"
+                )
+                rg.log(chunk, name=ctx.__listener__.dataset)
+
+            if chunk and memory_budget:
+                footprint = deep_sizeof(chunk)
+                log.info(f"memory footprint {footprint} of {memory_budget} bytes")
+                if footprint > memory_budget:
+                    ctx.query_params["page_size"] = max(
+                        1, len(chunk) * memory_budget // footprint
+                    )
+                    log.info(f"reduced page size to {ctx.query_params['page_size']}")
+            if id_from is None:
+                break
+
+    log.info(f"created a predictor listener with {query}")
+
+    return plugin
@@ -1,12 +1,290 @@
-import copy
+import itertools
 import logging
 import re
-import string
-from typing import Any, Dict, List, Set, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import argilla as rg
 from argilla import listener
-from argilla.utils.span_utils import SpanUtils
+
+from argilla_plugins.utils.memory import LRUDict, parse_memory_budget
+from argilla_plugins.utils.profiling import profiled
+from argilla_plugins.utils.sharding import load_shard
+from argilla_plugins.utils.state_store import get_state_store
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def token_offsets(
+    text: str, tokens: Optional[List[str]] = None
+) -> Tuple[List[int], List[int]]:
+    """
+    Get the sorted character start and end offsets of the tokens in the text.
+    Tokens are aligned the same way as `SpanUtils`. Without tokens, or if they can't be aligned,
+    the text is split on Unicode word boundaries instead.
+    """
+    if tokens:
+        starts, ends = [], []
+        end = 0
+        for token in tokens:
+            start = text.find(token, end)
+            if start == -1:
+                break
+            end = start + len(token)
+            starts.append(start)
+            ends.append(end)
+        else:
+            return starts, ends
+
+    starts, ends = [], []
+    for match in _WORD_PATTERN.finditer(text):
+        starts.append(match.start())
+        ends.append(match.end())
+    return starts, ends
+
+
+class WordIndex:
+    """
+    The words of a KB keyed by their text, lowercased when matching is not case sensitive, so a record is
+    labelled with dict lookups of its token spans instead of a scan per KB word. Build it once per run.
+
+    Args:
+        word_dict (dict): the KB, {"word": {"label": "label", "score": 0}}.
+        included_labels (list): only index words with these labels. Defaults to None, all labels.
+        case_sensitive (bool): if True, words are matched case sensitive. Defaults to True.
+    """
+
+    __slots__ = ("words", "max_length", "case_sensitive")
+
+    def __init__(
+        self,
+        word_dict: Dict[str, Dict[str, Any]],
+        included_labels: list = None,
+        case_sensitive: bool = True,
+    ):
+        self.case_sensitive = case_sensitive
+        self.words: Dict[str, Tuple[str, float]] = {}
+        for word, word_info in word_dict.items():
+            if included_labels is not None and word_info["label"] not in included_labels:
+                continue
+            key = word if case_sensitive else word.lower()
+            self.words[key] = (word_info["label"], word_info["score"])
+        self.max_length = max(map(len, self.words), default=0)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __eq__(self, other: Any) -> bool:
+        return (
+            isinstance(other, WordIndex)
+            and self.case_sensitive == other.case_sensitive
+            and self.words == other.words
+        )
+
+    def match(
+        self, text: str, offsets: Tuple[List[int], List[int]]
+    ) -> List[Tuple[str, int, int, float]]:
+        """Get the spans of all KB words that start and end on a token boundary, as [(label, start, end, score)]."""
+        if not self.words:
+            return []
+        starts, ends = offsets
+        record_info = []
+        for idx, start in enumerate(starts):
+            # token n-grams up to the longest KB word
+            for end in itertools.islice(ends, idx, None):
+                if end - start > self.max_length:
+                    break
+                # slices are lowercased rather than the text, lowercasing can change the length of a string
+                key = text[start:end]
+                word_info = self.words.get(key if self.case_sensitive else key.lower())
+                if word_info is not None:
+                    record_info.append((word_info[0], start, end, word_info[1]))
+        return record_info
+
+
+def apply_word_dict_kb(
+    text: str,
+    offsets: Tuple[List[int], List[int]],
+    word_dict: Union[Dict[str, Dict[str, Any]], WordIndex],
+    included_labels: list = None,
+    case_sensitive: bool = True,
+) -> List[Tuple[str, int, int, float]]:
+    """
+    For each know label and known word, get the character span from the text and assign it to the predictions as
+    [(label, start, end, score)]. Only spans starting and ending on a token boundary are kept, which also
+    rules out subwords. Pass a `WordIndex` to avoid indexing the KB for every record, `included_labels` and
+    `case_sensitive` are then taken from the index.
+    """
+    if not isinstance(word_dict, WordIndex):
+        word_dict = WordIndex(
+            word_dict, included_labels=included_labels, case_sensitive=case_sensitive
+        )
+    return word_dict.match(text, offsets)
+
+
+def resolve_span_overlap(
+    record_info: List[Tuple[str, int, int, float]]
+) -> List[Tuple[str, int, int, float]]:
+    """
+    Spans are provided as a list of tuples [(label, start, end, score)].
+    Spans are visited from longest to shortest, ties broken by start index.
+    A span is kept when it does not overlap any span that was kept before, so the longest span
+    wins and spans nested inside a longer span are removed.
+    Since longer spans are visited first, a span overlaps a kept span only if its first or last character is
+    taken. Only kept spans mark their characters and kept spans are disjoint, so the cost of marking is bounded
+    by the length of the text.
+    """
+
+    def get_sort_key(span):
+        return span[2] - span[1], -span[1]
+
+    result = []
+    seen_tokens: Set[int] = set()
+    for span in sorted(record_info, key=get_sort_key, reverse=True):
+        # Check for end - 1 here because boundaries are inclusive
+        if span[1] not in seen_tokens and span[2] - 1 not in seen_tokens:
+            result.append(span)
+            seen_tokens.update(range(span[1], span[2]))
+
+    return sorted(result, key=lambda span: span[1])
+
+
+def spans_changed(new: list, old: Optional[list]) -> bool:
+    """
+    Whether the spans resolved by `resolve_span_overlap`, sorted by start, differ from the old spans of a record,
+    in any order and treating None as no spans.
+    """
+    old = sorted(map(tuple, old or ()), key=lambda span: span[1])
+    return list(map(tuple, new)) != old
+
+
+def spans_known(spans: list, old: Optional[list]) -> bool:
+    """
+    Whether the KB spans, sorted by start as `apply_word_dict_kb` returns them, are all in the old spans of a record
+    and the old spans are already resolved, sorted by start and disjoint. Resolving them together then returns the
+    old spans, so the record is unchanged. This is checked in a single pass, without allocating span lists.
+    """
+    if not old:
+        return False
+    for prev, span in zip(old, itertools.islice(old, 1, None)):
+        if prev[2] > span[1]:
+            return False
+    idx = 0
+    for span in spans:
+        # the starts of sorted disjoint spans increase
+        while idx < len(old) and old[idx][1] < span[1]:
+            idx += 1
+        if idx == len(old) or tuple(old[idx]) != span:
+            return False
+    return True
+
+
+def copy_spans(
+    text: str,
+    tokens: Optional[List[str]],
+    prediction: Optional[list],
+    annotation: Optional[list],
+    word_dict_kb_predictions: Union[Dict[str, Dict[str, Any]], WordIndex] = None,
+    word_dict_kb_annotations: Union[Dict[str, Dict[str, Any]], WordIndex] = None,
+    included_labels: list = None,
+    case_sensitive: bool = True,
+) -> Optional[Tuple[Optional[list], Optional[list]]]:
+    """
+    Apply the KBs to a single record and return its new (prediction, annotation), or None if
+    neither changed. A KB that is None is not applied and the corresponding spans are returned untouched.
+    KBs are best passed as a `WordIndex`, built once for all records.
+    Spans are only resolved and compared when the KB matched something new, so unchanged records
+    don't allocate new span lists.
+    """
+    changed = False
+    offsets = token_offsets(text, tokens)
+    if word_dict_kb_predictions is not None:
+        validated_spans = apply_word_dict_kb(
+            text,
+            offsets,
+            word_dict_kb_predictions,
+            included_labels=included_labels,
+            case_sensitive=case_sensitive,
+        )
+        if validated_spans and not spans_known(validated_spans, prediction):
+            new_prediction = resolve_span_overlap((prediction or []) + validated_spans)
+            if spans_changed(new_prediction, prediction):
+                prediction = new_prediction
+                changed = True
+    if word_dict_kb_annotations is not None:
+        validated_spans = apply_word_dict_kb(
+            text,
+            offsets,
+            word_dict_kb_annotations,
+            included_labels=included_labels,
+            case_sensitive=case_sensitive,
+        )
+        validated_spans = [span[:-1] for span in validated_spans]
+        if validated_spans and not spans_known(validated_spans, annotation):
+            new_annotation = resolve_span_overlap((annotation or []) + validated_spans)
+            if spans_changed(new_annotation, annotation):
+                annotation = new_annotation
+                changed = True
+    if changed:
+        return prediction, annotation
+    return None
+
+
+# KBs and settings shipped once to each worker process by `_init_worker`
+_WORKER_KWARGS: Dict[str, Any] = {}
+
+
+def _init_worker(kwargs: Dict[str, Any]):
+    _WORKER_KWARGS.update(kwargs)
+
+
+def _copy_spans_batch(
+    batch: List[tuple],
+) -> List[Optional[Tuple[Optional[list], Optional[list]]]]:
+    return [copy_spans(*item, **_WORKER_KWARGS) for item in batch]
+
+
+class _WorkerPool:
+    """
+    A process pool kept for the lifetime of a plugin. The KBs are shipped to the workers when the pool starts,
+    and the pool is only restarted when the KBs change. Batches are submitted as results are consumed, with at
+    most two batches per worker in flight.
+    """
+
+    def __init__(self, n_jobs: int):
+        self.n_jobs = n_jobs
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._kwargs: Optional[Dict[str, Any]] = None
+
+    def map(
+        self, batches: Iterable[List[tuple]], kwargs: Dict[str, Any]
+    ) -> Iterator[List[Optional[Tuple[Optional[list], Optional[list]]]]]:
+        if self._executor is None or kwargs != self._kwargs:
+            self.shutdown()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.n_jobs, initializer=_init_worker, initargs=(kwargs,)
+            )
+            self._kwargs = kwargs
+        pending = deque()
+        try:
+            for batch in batches:
+                pending.append(self._executor.submit(_copy_spans_batch, batch))
+                if len(pending) >= 2 * self.n_jobs:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            self.shutdown()
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._executor = None
+        self._kwargs = None
 
 
 def token_copycat(
@@ -18,6 +296,13 @@ def token_copycat(
     word_dict_kb_predictions: dict = None,
     included_labels: list = None,
     case_sensitive: bool = True,
+    n_jobs: int = 1,
+    batch_size: int = 1000,
+    min_parallel_records: int = None,
+    state_store=None,
+    sharding=None,
+    memory_budget=None,
+    profile=None,
     *args,
     **kwargs,
 ) -> callable:
@@ -36,6 +321,20 @@ def token_copycat(
             Defaults to False
         included_labels (list): list = None, a list of labels that will be copied from the KB to the record
         case_sensitive (bool): bool = True, if True, the word_dict matching will be case sensitive. Defaults to True
+        n_jobs (int): int = 1, the number of worker processes used to apply the KB. The worker processes are kept
+            for the lifetime of the plugin and the KB is only sent to them again when it changed. Records are
+            streamed to them in batches. Defaults to 1, no worker processes.
+        batch_size (int): int = 1000, the number of records sent to a worker process at once.
+        min_parallel_records (int): int = None, runs with fewer records are labelled in the listener process.
+            Defaults to twice the `batch_size`.
+        state_store (Union[str, StateStore]): = None, a state store, or a path to one, used to persist the KBs so a
+            restarted listener resumes with them. Defaults to None.
+        sharding (ShardCoordinator): = None, split the labelling of records over workers by a hash of their id.
+            Every worker still builds the KB from all annotated records. Defaults to None.
+        memory_budget (Union[int, str]): = None, the memory budget of the KBs and seen words, e.g. "256MB". Once it is
+            exceeded the least recently seen words are evicted. Defaults to None, no budget.
+        profile (Union[str, Profiler]): a `Profiler`, or a directory, to profile the first runs of the plugin
+            with cProfile. Defaults to None, the `--profile` CLI option if given.
 
     Returns:
         A function that takes in a dataset and a context and returns a dataset with the annotations and
@@ -45,12 +344,37 @@ def token_copycat(
     assert any([copy_predictions, copy_annotations]), ValueError(
         "choose to use at least one of the copy_prediction or copy_annotations"
     )
-    seen_words = set()
+    assert n_jobs > 0, ValueError("`n_jobs` must be positive")
+    assert batch_size > 0, ValueError("`batch_size` must be positive")
+    if min_parallel_records is None:
+        min_parallel_records = 2 * batch_size
+    pool = _WorkerPool(n_jobs) if n_jobs > 1 else None
     if word_dict_kb_annotations is None:
         word_dict_kb_annotations = {}
     if word_dict_kb_predictions is None:
         word_dict_kb_predictions = {}
 
+    state_store = get_state_store(state_store)
+    state_key = f"token_copycat/{name}"
+    state = state_store.load(state_key) if state_store else {}
+
+    # the budget is shared by the seen words and the KBs that are copied, a KB that is not copied stays as is
+    memory_budget = parse_memory_budget(memory_budget)
+    max_bytes = None
+    if memory_budget:
+        max_bytes = memory_budget // (1 + bool(copy_predictions) + bool(copy_annotations))
+    seen_words = LRUDict(
+        ((word, None) for word in state.get("seen_words", ())), max_bytes=max_bytes
+    )
+    word_dict_kb_annotations = LRUDict(
+        {**word_dict_kb_annotations, **state.get("word_dict_kb_annotations", {})},
+        max_bytes=max_bytes if copy_annotations else None,
+    )
+    word_dict_kb_predictions = LRUDict(
+        {**word_dict_kb_predictions, **state.get("word_dict_kb_predictions", {})},
+        max_bytes=max_bytes if copy_predictions else None,
+    )
+
     query_part = []
     if copy_predictions:
         query_part.append("(annotated_as: *)")
@@ -74,45 +398,8 @@ def token_copycat(
         word_dict_kb_predictions=word_dict_kb_predictions,
         word_dict_kb_annotations=word_dict_kb_annotations,
     )
+    @profiled(profile, f"token_copycat-{name}")
     def plugin(records, ctx):
-        def apply_word_dict_kb(
-            rec: Any, word_dict: Dict[str, Dict[str, Any]]
-        ) -> List[Tuple[str, int, int, float]]:
-            """
-            For each know label and known word, get the character span from the text and assign it to the predictions as
-            [(label, start, end, 0)]
-            """
-            util_rec = SpanUtils(rec.text, rec.tokens)
-            record_info = []
-            for word, word_info in word_dict.items():
-                if (
-                    included_labels is not None
-                    and word_info["label"] not in included_labels
-                ):
-                    continue
-
-                if case_sensitive:
-                    start = [m.start() for m in re.finditer(word, rec.text)]
-                else:
-                    start = [
-                        m.start() for m in re.finditer(word.lower(), rec.text.lower())
-                    ]
-                for s in start:
-                    end = s + len(word)
-                    if end < len(rec.text):
-                        # check if not alpha
-                        if (
-                            rec.text[end] not in string.ascii_letters
-                        ):  # ensure it is not a subword
-                            try:
-                                util_rec.validate([(word_info["label"], s, end)])
-                                record_info.append(
-                                    (word_info["label"], s, end, word_info["score"])
-                                )
-                            except Exception:
-                                pass
-            return record_info
-
         def update_word_dict_kb(
             rec: Any,
             rec_info: List[Tuple[str, int, int, float]],
@@ -130,33 +417,10 @@ def token_copycat(
                 if included_labels is not None and label not in included_labels:
                     continue
                 word = rec.text[start:end]
-                seen_words.add(word)
+                seen_words[word] = None
                 word_dict[word] = {"label": label, "score": score}
             return word_dict
 
-        def resolve_span_overlap(
-            record_info: List[Tuple[str, int, int, float]]
-        ) -> List[Tuple[str, int, int, float]]:
-            """
-            Spans are provided as a list of tuples [(label, start, end, score)].
-            This list is sorted by start index.
-            Then this function checks if there is an overlap between the spans.
-            The longest span is kept and the other is removed.
-            """
-            def get_sort_key(record_info):
-                return record_info[2] - record_info[1], -record_info[1]
-            sorted_spans = sorted(record_info, key=get_sort_key, reverse=True)
-            result = []
-            seen_tokens: Set[int] = set()
-            for span in sorted_spans:
-                # Check for end - 1 here because boundaries are inclusive
-                if span[1] not in seen_tokens and span[2] - 1 not in seen_tokens:
-                    result.append(span)
-                    seen_tokens.update(range(span[1], span[2]))
-            result = sorted(result, key=lambda span: span[1])
-
-            return result
-
         # gather all potential info from the kb
         for rec in records:
             if copy_predictions and rec.prediction:
@@ -168,38 +432,71 @@ def token_copycat(
                     rec, rec.annotation, ctx.query_params["word_dict_kb_annotations"]
                 )
 
+        if memory_budget:
+            kbs = [seen_words]
+            if copy_annotations:
+                kbs.append(ctx.query_params["word_dict_kb_annotations"])
+            if copy_predictions:
+                kbs.append(ctx.query_params["word_dict_kb_predictions"])
+            log.info(
+                f"memory footprint {sum(kb.nbytes for kb in kbs)} of {memory_budget}"
+                f" bytes, evicted {sum(kb.n_evicted for kb in kbs)} words"
+            )
+
+        if state_store:
+            state_store.save(
+                state_key,
+                {
+                    "seen_words": seen_words,
+                    "word_dict_kb_annotations": ctx.query_params[
+                        "word_dict_kb_annotations"
+                    ],
+                    "word_dict_kb_predictions": ctx.query_params[
+                        "word_dict_kb_predictions"
+                    ],
+                },
+            )
+
         query_relevant = f'({" OR ".join(list(seen_words))})'
 
 
         # update the kb_info in the record
-        new_records = rg.load(ctx.__listener__.dataset, query=query_relevant)
-        updated_records = []
-        for rec in new_records:
-            rec_predictions_old = copy.deepcopy(rec.prediction)
-            rec_annotations_old = copy.deepcopy(rec.annotation)
-            if copy_predictions:
-                validated_spans = apply_word_dict_kb(
-                    rec, ctx.query_params["word_dict_kb_predictions"]
-                )
-                if rec.prediction is None:
-                    rec.prediction = []
-                rec.prediction += validated_spans
-                rec.prediction = resolve_span_overlap(rec.prediction)
-            if copy_annotations:
-                validated_spans = apply_word_dict_kb(
-                    rec, ctx.query_params["word_dict_kb_annotations"]
-                )
-                if rec.annotation is None:
-                    rec.annotation = []
-                rec.annotation = resolve_span_overlap(rec.annotation + [span[:-1] for span in validated_spans])
-            if (
-                rec_predictions_old != rec.prediction
-                or rec_annotations_old != rec.annotation
-            ):
-                rec = rec.__class__(**rec.__dict__)
-                updated_records.append(rec)
+        if sharding is None:
+            new_records = rg.load(ctx.__listener__.dataset, query=query_relevant)
+        elif sharding.acquire() is None:
+            log.info("no free shard, waiting")
+            return
+        else:
+            new_records = load_shard(
+                ctx.__listener__.dataset, sharding, query=query_relevant
+            )
+        # the KBs are indexed once per run, not once per record
+        copy_kwargs = {
+            "word_dict_kb_predictions": WordIndex(
+                ctx.query_params["word_dict_kb_predictions"],
+                included_labels=included_labels,
+                case_sensitive=case_sensitive,
+            )
+            if copy_predictions
+            else None,
+            "word_dict_kb_annotations": WordIndex(
+                ctx.query_params["word_dict_kb_annotations"],
+                included_labels=included_labels,
+                case_sensitive=case_sensitive,
+            )
+            if copy_annotations
+            else None,
+        }
+        items = (
+            (rec.text, rec.tokens, rec.prediction, rec.annotation) for rec in new_records
+        )
+        if pool is not None and len(new_records) >= min_parallel_records:
+            batches = iter(lambda: list(itertools.islice(items, batch_size)), [])
+            results = itertools.chain.from_iterable(pool.map(batches, copy_kwargs))
+        else:
+            results = (copy_spans(*item, **copy_kwargs) for item in items)
 
-        if updated_records:
+        def log_updated(updated_records):
             log.info(f"updating {len(updated_records)} records")
             rg.log(
                 records=updated_records,
@@ -208,6 +505,25 @@ def token_copycat(
                 chunk_size=20
             )
 
+        updated_records = []
+        for idx, (rec, result) in enumerate(zip(new_records, results)):
+            # a long run renews the lease on every batch, and stops when the shard was taken over
+            if sharding is not None and idx and idx % batch_size == 0:
+                if updated_records:
+                    log_updated(updated_records)
+                    updated_records = []
+                if not sharding.renew():
+                    log.info("lost the lease of the shard, stopping")
+                    return
+            # only changed records are copied and rebuilt
+            if result is not None:
+                rec.prediction, rec.annotation = result
+                rec = rec.__class__(**rec.__dict__)
+                updated_records.append(rec)
+
+        if updated_records:
+            log_updated(updated_records)
+
     log.info(f"copycat ready to mimick your annotations and predictions {query}.")
 
     return plugin
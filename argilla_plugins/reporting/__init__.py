@@ -0,0 +1,6 @@
+from argilla_plugins.reporting.datapane_report import datapane_report
+from argilla_plugins.reporting.great_expectations_report import (
+    great_expectations_report,
+)
+
+__all__ = ["datapane_report", "great_expectations_report"]
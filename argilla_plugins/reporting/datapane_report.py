@@ -0,0 +1,281 @@
+import datetime
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+import pandas as pd
+from argilla import listener
+
+from argilla_plugins.utils.dependency_checker import import_package
+from argilla_plugins.utils.profiling import profiled
+from argilla_plugins.utils.records import get_labels, with_fields
+
+
+class ReportAggregates:
+    """
+    Running aggregates over the records of a dataset.
+
+    Every record contributes once. When a record is seen again, e.g. because it was annotated, its
+    previous contribution is replaced, so only new and updated records have to be processed.
+    Annotation throughput is bucketed by the first time a record was seen annotated, so re-logging an
+    annotated record does not move its annotation to a later period.
+
+    Args:
+        text_length_bin_size (int): the width of the text length histogram bins in characters.
+        throughput_freq (str): the pandas frequency used to bucket annotation throughput.
+    """
+
+    def __init__(self, text_length_bin_size: int = 50, throughput_freq: str = "1h"):
+        self.text_length_bin_size = text_length_bin_size
+        self.throughput_freq = throughput_freq
+        self.contributions: Dict[Any, tuple] = {}
+        self.label_counts = Counter()
+        self.prediction_counts = Counter()
+        self.throughput = Counter()
+        self.agreement = Counter()
+        self.annotator_counts = Counter()
+        self.text_lengths = Counter()
+
+    def update(self, records: Iterable[Any]) -> int:
+        """Add or replace the contribution of the records and return the number of records that changed."""
+        n_changed = 0
+        for rec in records:
+            previous = self.contributions.get(rec.id)
+            contribution = self._contribution(rec, previous)
+            if previous == contribution:
+                continue
+            if previous is not None:
+                self._apply(previous, -1)
+            self._apply(contribution, 1)
+            self.contributions[rec.id] = contribution
+            n_changed += 1
+        return n_changed
+
+    def _contribution(self, rec: Any, previous: Optional[tuple] = None) -> tuple:
+        annotated_at = None
+        last_updated = getattr(rec, "last_updated", None)
+        if rec.annotation and previous is not None and previous[3] is not None:
+            # keep the period in which the record was first seen annotated
+            annotated_at = previous[3]
+        elif rec.annotation and last_updated is not None:
+            annotated_at = pd.Timestamp(last_updated).floor(self.throughput_freq)
+        text_length_bin = None
+        if rec.text is not None:
+            text_length_bin = len(rec.text) // self.text_length_bin_size
+        return (
+            get_labels(rec.annotation),
+            get_labels(rec.prediction),
+            rec.annotation_agent if rec.annotation else None,
+            annotated_at,
+            _agrees(rec),
+            text_length_bin,
+        )
+
+    def _apply(self, contribution: tuple, sign: int):
+        labels, predicted_labels, agent, annotated_at, agrees, text_length_bin = contribution
+        for label in labels:
+            self.label_counts[label] += sign
+        for label in predicted_labels:
+            self.prediction_counts[label] += sign
+        if agent is not None:
+            self.annotator_counts[agent] += sign
+        if annotated_at is not None:
+            self.throughput[annotated_at] += sign
+        if agrees is not None:
+            self.agreement[(agent, agrees)] += sign
+        if text_length_bin is not None:
+            self.text_lengths[text_length_bin] += sign
+
+    @property
+    def n_records(self) -> int:
+        return len(self.contributions)
+
+    @property
+    def n_annotated(self) -> int:
+        return sum(self.annotator_counts.values())
+
+    def to_frames(self) -> Dict[str, pd.DataFrame]:
+        """The aggregates as pandas DataFrames, keyed by a section title."""
+        agreement = pd.DataFrame(
+            [
+                {"annotator": agent, "agrees": agrees, "records": count}
+                for (agent, agrees), count in self.agreement.items()
+                if count
+            ],
+            columns=["annotator", "agrees", "records"],
+        )
+        if not agreement.empty:
+            agreement = (
+                agreement.pivot_table(
+                    index="annotator", columns="agrees", values="records", fill_value=0
+                )
+                .reindex(columns=[True, False], fill_value=0)
+                .rename(columns={True: "agree", False: "disagree"})
+                .reset_index()
+            )
+            agreement["agreement"] = agreement["agree"] / (
+                agreement["agree"] + agreement["disagree"]
+            )
+
+        return {
+            "Label distribution": _counter_frame(
+                self.label_counts, "label", "annotations"
+            ).merge(
+                _counter_frame(self.prediction_counts, "label", "predictions"),
+                on="label",
+                how="outer",
+            ),
+            "Annotation throughput": _counter_frame(
+                self.throughput, "period", "annotations"
+            ),
+            "Annotators": _counter_frame(self.annotator_counts, "annotator", "records"),
+            "Annotation/prediction agreement": agreement,
+            "Text length": pd.DataFrame(
+                [
+                    {
+                        "length": f"{bin_ * self.text_length_bin_size}"
+                        f"-{(bin_ + 1) * self.text_length_bin_size - 1}",
+                        "records": count,
+                    }
+                    for bin_, count in sorted(self.text_lengths.items())
+                    if count
+                ],
+                columns=["length", "records"],
+            ),
+        }
+
+
+def _counter_frame(counter: Counter, key: str, value: str) -> pd.DataFrame:
+    return pd.DataFrame(
+        [{key: k, value: v} for k, v in sorted(counter.items(), key=lambda kv: str(kv[0])) if v],
+        columns=[key, value],
+    )
+
+
+def _agrees(rec: Any) -> Optional[bool]:
+    """Whether the annotation agrees with the prediction, None if the record lacks either."""
+    if not rec.annotation or not rec.prediction:
+        return None
+    annotation = rec.annotation if isinstance(rec.annotation, list) else [rec.annotation]
+    # token classification, compare the spans
+    if isinstance(annotation[0], (tuple, list)):
+        return {tuple(span[:3]) for span in annotation} == {
+            tuple(span[:3]) for span in rec.prediction
+        }
+    if getattr(rec, "multi_label", False):
+        predicted = {label for label, score in rec.prediction if score and score >= 0.5}
+    else:
+        predicted = {max(rec.prediction, key=lambda pred: pred[1] or 0)[0]}
+    return set(annotation) == predicted
+
+
+def datapane_report(
+    name: str,
+    query: str = None,
+    output_path: str = None,
+    report_interval_in_seconds: int = 60,
+    text_length_bin_size: int = 50,
+    throughput_freq: str = "1h",
+    profile=None,
+    *args,
+    **kwargs,
+):
+    """
+    It creates a listener that keeps running aggregates of a dataset and renders them as a `datapane` report.
+    Each run only fetches the records updated since the previous run, so the dataset is never rescanned.
+
+    Args:
+        name (str): the name of the dataset to which the plugin will be applied.
+        query (str): a query string to filter the records that will be reported on.
+        output_path (str): the path of the HTML report. Defaults to "{name}-report.html".
+        report_interval_in_seconds (int): the minimum number of seconds between two renders of the report.
+            Defaults to 60.
+        text_length_bin_size (int): the width of the text length histogram bins in characters. Defaults to 50.
+        throughput_freq (str): the pandas frequency used to bucket annotation throughput. Defaults to "1h".
+        profile (Union[str, Profiler]): a `Profiler`, or a directory, to profile the first runs of the plugin
+            with cProfile. Defaults to None, the `--profile` CLI option if given.
+
+    Returns:
+        A listener that updates the aggregates and renders the report.
+    """
+    import_package("datapane")
+    import datapane as dp
+
+    log = logging.getLogger(f"datapane_report | {name}")
+
+    assert report_interval_in_seconds >= 0, ValueError(
+        "`report_interval_in_seconds` must be positive"
+    )
+    assert text_length_bin_size > 0, ValueError(
+        "`text_length_bin_size` must be positive"
+    )
+
+    if output_path is None:
+        output_path = f"{name}-report.html"
+
+    query_parts = ["last_updated:[{last_updated} TO *]"]
+    if query:
+        query_parts.insert(0, f"({query})")
+    query = " AND ".join(query_parts)
+
+    def render(aggregates: ReportAggregates):
+        blocks = [
+            dp.Text(f"# {name}"),
+            dp.Text(
+                f"Generated at {datetime.datetime.now().isoformat(timespec='seconds')}"
+            ),
+            dp.Group(
+                dp.BigNumber(heading="Records", value=aggregates.n_records),
+                dp.BigNumber(heading="Annotated", value=aggregates.n_annotated),
+                columns=2,
+            ),
+        ]
+        for title, frame in aggregates.to_frames().items():
+            blocks.append(dp.Text(f"## {title}"))
+            blocks.append(dp.Table(frame))
+        dp.Report(*blocks).save(path=output_path)
+        log.info(f"rendered report to {output_path}")
+
+    @listener(
+        dataset=name,
+        query=query,
+        with_records=False,
+        *args,
+        **kwargs,
+        last_updated="*",
+        aggregates=ReportAggregates(
+            text_length_bin_size=text_length_bin_size, throughput_freq=throughput_freq
+        ),
+        last_report=None,
+        pending=False,
+    )
+    @profiled(profile, f"datapane_report-{name}")
+    @with_fields(
+        ["text", "annotation", "annotation_agent", "prediction", "last_updated"]
+    )
+    def plugin(records, ctx):
+        aggregates = ctx.query_params["aggregates"]
+        n_changed = aggregates.update(records)
+        if n_changed:
+            log.info(f"updated aggregates with {n_changed} records")
+            ctx.query_params["pending"] = True
+
+        last_updated = [
+            rec.last_updated for rec in records if getattr(rec, "last_updated", None)
+        ]
+        if last_updated:
+            ctx.query_params["last_updated"] = max(last_updated).isoformat()
+
+        last_report = ctx.query_params["last_report"]
+        if ctx.query_params["pending"] and (
+            last_report is None
+            or time.monotonic() - last_report >= report_interval_in_seconds
+        ):
+            render(aggregates)
+            ctx.query_params["last_report"] = time.monotonic()
+            ctx.query_params["pending"] = False
+
+    log.info(f"created a datapane_report listener with {query}")
+
+    return plugin
@@ -0,0 +1,234 @@
+import datetime
+import json
+import logging
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+import pandas as pd
+from argilla import listener
+
+from argilla_plugins.utils.dependency_checker import import_package
+from argilla_plugins.utils.profiling import profiled
+from argilla_plugins.utils.records import get_labels, with_fields
+
+
+def _fingerprint(rec: Any) -> int:
+    """A hash of the validated content of a record, used to skip unchanged records."""
+    vectors = getattr(rec, "vectors", None) or {}
+    return hash(
+        (
+            rec.text,
+            get_labels(rec.annotation),
+            tuple(tuple(pred) for pred in rec.prediction or ()),
+            tuple(sorted((name, len(vector)) for name, vector in vectors.items())),
+        )
+    )
+
+
+def _validation_frames(
+    records: List[Any], vector_names: Iterable[str]
+) -> Dict[str, pd.DataFrame]:
+    """Flatten records into a frame with a row per record and a frame with a row per label."""
+    rows, label_rows = [], []
+    for rec in records:
+        vectors = getattr(rec, "vectors", None) or {}
+        row = {"id": rec.id, "text": rec.text}
+        for vector_name in vector_names:
+            vector = vectors.get(vector_name)
+            row[f"vectors.{vector_name}"] = len(vector) if vector is not None else None
+        rows.append(row)
+        for label in get_labels(rec.annotation):
+            label_rows.append({"id": rec.id, "label": label, "score": None})
+        for pred in rec.prediction or []:
+            label_rows.append({"id": rec.id, "label": pred[0], "score": pred[-1]})
+    return {
+        "records": pd.DataFrame(
+            rows, columns=["id", "text"] + [f"vectors.{name}" for name in vector_names]
+        ),
+        "labels": pd.DataFrame(label_rows, columns=["id", "label", "score"]),
+    }
+
+
+def great_expectations_report(
+    name: str,
+    query: str = None,
+    output_path: str = None,
+    allowed_labels: list = None,
+    score_range: Tuple[float, float] = (0.0, 1.0),
+    vector_dimensions: Dict[str, int] = None,
+    batch_size: int = 1000,
+    profile=None,
+    *args,
+    **kwargs,
+):
+    """
+    It creates a listener that validates records with a `great-expectations` suite and writes a local
+    validation report. Each run only fetches records updated since the previous run and results are cached
+    per record id, so unchanged records are never validated twice.
+
+    The suite expects:
+        - non-empty texts.
+        - annotated and predicted labels within `allowed_labels`, if provided.
+        - prediction scores within `score_range`, if provided.
+        - vectors with the dimensions given in `vector_dimensions`, if provided.
+
+    Args:
+        name (str): the name of the dataset to which the plugin will be applied.
+        query (str): a query string to filter the records that will be validated.
+        output_path (str): the path of the JSON validation report. Defaults to "{name}-validation.json".
+        allowed_labels (list): the labels that are allowed in annotations and predictions. Defaults to None.
+        score_range (tuple): the (min, max) range of prediction scores. Defaults to (0, 1).
+        vector_dimensions (dict): the expected dimension per vector name, e.g. {"vector": 384}. Defaults to None.
+        batch_size (int): the number of records validated at once. Defaults to 1000.
+        profile (Union[str, Profiler]): a `Profiler`, or a directory, to profile the first runs of the plugin
+            with cProfile. Defaults to None, the `--profile` CLI option if given.
+
+    Returns:
+        A listener that validates new records and updates the report.
+    """
+    import_package("great_expectations")
+    import great_expectations as ge
+
+    log = logging.getLogger(f"great_expectations_report | {name}")
+
+    assert batch_size > 0, ValueError("`batch_size` must be positive")
+
+    if output_path is None:
+        output_path = f"{name}-validation.json"
+    if vector_dimensions is None:
+        vector_dimensions = {}
+
+    # (name, frame, expectation, column, kwargs)
+    suite = [
+        ("text_not_null", "records", "expect_column_values_to_not_be_null", "text", {}),
+        (
+            "text_not_empty",
+            "records",
+            "expect_column_values_to_not_match_regex",
+            "text",
+            {"regex": r"^\s*$"},
+        ),
+    ]
+    if allowed_labels is not None:
+        suite.append(
+            (
+                "allowed_labels",
+                "labels",
+                "expect_column_values_to_be_in_set",
+                "label",
+                {"value_set": list(allowed_labels)},
+            )
+        )
+    if score_range is not None:
+        suite.append(
+            (
+                "score_range",
+                "labels",
+                "expect_column_values_to_be_between",
+                "score",
+                {"min_value": score_range[0], "max_value": score_range[1]},
+            )
+        )
+    for vector_name, dimension in vector_dimensions.items():
+        suite.append(
+            (
+                f"vector_dimensions.{vector_name}",
+                "records",
+                "expect_column_values_to_be_in_set",
+                f"vectors.{vector_name}",
+                {"value_set": [dimension]},
+            )
+        )
+
+    def validate(records: List[Any]) -> Dict[Any, Tuple[str, ...]]:
+        """Run the suite over a batch of records and return the failed expectations per record id."""
+        frames = _validation_frames(records, vector_dimensions.keys())
+        datasets = {key: ge.from_pandas(frame) for key, frame in frames.items()}
+        failures = {rec.id: [] for rec in records}
+        for expectation_name, frame, expectation, column, expectation_kwargs in suite:
+            if frames[frame].empty:
+                continue
+            result = getattr(datasets[frame], expectation)(
+                column, result_format="COMPLETE", **expectation_kwargs
+            )
+            for idx in result.result.get("unexpected_index_list") or []:
+                rec_id = frames[frame].at[idx, "id"]
+                if expectation_name not in failures[rec_id]:
+                    failures[rec_id].append(expectation_name)
+        return {rec_id: tuple(failed) for rec_id, failed in failures.items()}
+
+    def write_report(results: Dict[Any, Tuple[int, Tuple[str, ...]]]):
+        failed_ids = {expectation_name: [] for expectation_name, *_ in suite}
+        for rec_id, (_, failed) in results.items():
+            for expectation_name in failed:
+                failed_ids[expectation_name].append(rec_id)
+        report = {
+            "dataset": name,
+            "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "n_records": len(results),
+            "n_failed_records": sum(bool(failed) for _, failed in results.values()),
+            "expectations": {
+                expectation_name: {
+                    "success": not ids,
+                    "n_failed_records": len(ids),
+                    "failed_record_ids": ids,
+                }
+                for expectation_name, ids in failed_ids.items()
+            },
+        }
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        os.replace(tmp_path, output_path)
+
+    query_parts = ["last_updated:[{last_updated} TO *]"]
+    if query:
+        query_parts.insert(0, f"({query})")
+    query = " AND ".join(query_parts)
+
+    fields = ["text", "annotation", "prediction", "last_updated"]
+    if vector_dimensions:
+        fields.append("vectors")
+
+    @listener(
+        dataset=name,
+        query=query,
+        with_records=False,
+        *args,
+        **kwargs,
+        last_updated="*",
+        results={},
+    )
+    @profiled(profile, f"great_expectations_report-{name}")
+    @with_fields(fields)
+    def plugin(records, ctx):
+        results = ctx.query_params["results"]
+        last_updated = [
+            rec.last_updated for rec in records if getattr(rec, "last_updated", None)
+        ]
+        if last_updated:
+            ctx.query_params["last_updated"] = max(last_updated).isoformat()
+
+        # skip records that were validated before and did not change
+        fingerprints = {rec.id: _fingerprint(rec) for rec in records}
+        records = [
+            rec
+            for rec in records
+            if rec.id not in results or results[rec.id][0] != fingerprints[rec.id]
+        ]
+
+        counter = Counter()
+        for i in range(0, len(records), batch_size):
+            batch = records[i : i + batch_size]
+            for rec_id, failed in validate(batch).items():
+                results[rec_id] = (fingerprints[rec_id], failed)
+                counter.update(failed)
+
+        if records:
+            log.info(f"validated {len(records)} records, failures: {dict(counter)}")
+            write_report(results)
+
+    log.info(f"created a great_expectations_report listener with {query}")
+
+    return plugin
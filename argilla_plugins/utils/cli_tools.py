@@ -1,3 +1,57 @@
+import functools
+import inspect
+from typing import Callable, Iterable
+
 import typer
 
+from argilla_plugins.utils.profiling import Profiler, set_default_profiler
+
 app = typer.Typer()
+
+
+@app.callback()
+def main(
+    profile: str = typer.Option(
+        None,
+        "--profile",
+        help="Profile the plugin runs with cProfile and dump a `.pstats` file per run to this directory.",
+    ),
+    profile_ticks: int = typer.Option(
+        10, "--profile-ticks", help="The number of runs to profile per plugin."
+    ),
+):
+    if profile is not None:
+        set_default_profiler(Profiler(profile, n_ticks=profile_ticks))
+
+
+def command(exclude: Iterable[str] = ()) -> Callable:
+    """
+    Register a plugin as a CLI command that creates its listener and starts it.
+
+    `*args` and `**kwargs`, which are forwarded to the listener, `profile`, which is set by the `--profile` option
+    of the CLI, and the `exclude` parameters, which take Python objects, are left out of the command options.
+    The plugin itself is returned untouched.
+
+    Args:
+        exclude (Iterable[str]): the names of the parameters that are not CLI options. Defaults to ().
+    """
+    exclude = {"profile", *exclude}
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        parameters = [
+            param
+            for param in signature.parameters.values()
+            if param.kind not in (param.VAR_POSITIONAL, param.VAR_KEYWORD)
+            and param.name not in exclude
+        ]
+
+        @functools.wraps(func)
+        def run(**kwargs):
+            func(**kwargs).start()
+
+        run.__signature__ = signature.replace(parameters=parameters)
+        app.command(name=func.__name__.replace("_", "-"))(run)
+        return func
+
+    return decorator
@@ -0,0 +1,148 @@
+import re
+import sys
+import types
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+
+_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def parse_memory_budget(memory_budget: Union[int, str, None]) -> Optional[int]:
+    """
+    Parse a memory budget like 1048576, "512MB" or "2 GB" into bytes.
+
+    Args:
+        memory_budget (Union[int, str, None]): the budget, None for no budget.
+
+    Returns:
+        The budget in bytes, or None.
+    """
+    if memory_budget is None:
+        return None
+    if isinstance(memory_budget, str):
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*", memory_budget.upper())
+        if match is None:
+            raise ValueError(f"invalid memory budget {memory_budget}")
+        memory_budget = float(match.group(1)) * _UNITS[match.group(2).rstrip("B")]
+    assert memory_budget > 0, ValueError("`memory_budget` must be positive")
+    return int(memory_budget)
+
+
+def deep_sizeof(obj: Any) -> int:
+    """An estimate of the memory used by an object and the containers, strings and arrays it holds."""
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            size += obj.nbytes + sys.getsizeof(np.empty(0))
+            if obj.dtype == object:
+                stack.extend(obj.ravel().tolist())
+            continue
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__slots__"):
+            stack.extend(getattr(obj, slot, None) for slot in obj.__slots__)
+        elif hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+    return size
+
+
+class LRUDict(OrderedDict):
+    """
+    A dict that evicts its least recently set or read entries once their estimated size exceeds `max_bytes`.
+
+    Args:
+        max_bytes (int): the memory budget of the entries, None for no budget. Entries are only sized under a
+            budget, so `nbytes` stays 0 without one.
+        sizeof (Callable): estimates the size of a key and value. Defaults to `deep_sizeof` of both. It is not
+            pickled, so an unpickled dict always uses the default.
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any, Any], int] = None,
+        **kwargs,
+    ):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda key, value: deep_sizeof(key) + deep_sizeof(value))
+        self.nbytes = 0
+        self.n_evicted = 0
+        self._sizes = {}
+        super().__init__()
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        if self.max_bytes is None:
+            # without a budget nothing is evicted, so the entries are not sized
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            return
+        if key in self:
+            self.nbytes -= self._sizes[key]
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        self._sizes[key] = self.sizeof(key, value)
+        self.nbytes += self._sizes[key]
+        self._evict()
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.nbytes -= self._sizes.pop(key, 0)
+
+    def pop(self, key, *default):
+        if key in self:
+            value = super().__getitem__(key)
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def clear(self):
+        super().clear()
+        self._sizes.clear()
+        self.nbytes = 0
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        # always keep the most recent entry
+        while self.nbytes > self.max_bytes and len(self) > 1:
+            key = next(iter(self))
+            del self[key]
+            self.n_evicted += 1
+
+    def __reduce__(self):
+        return (
+            self.__class__,
+            (list(self.items()),),
+            {"max_bytes": self.max_bytes, "n_evicted": self.n_evicted},
+        )
+
+    def __setstate__(self, state):
+        self.max_bytes = state["max_bytes"]
+        self.n_evicted = state["n_evicted"]
+        if self.max_bytes is not None:
+            self._sizes = {key: self.sizeof(key, value) for key, value in self.items()}
+            self.nbytes = sum(self._sizes.values())
+        self._evict()
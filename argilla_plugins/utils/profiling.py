@@ -0,0 +1,102 @@
+import cProfile
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Optional, Union
+
+log = logging.getLogger("profiling")
+
+
+class Profiler:
+    """
+    Profile the first `n_ticks` runs of a listener body with `cProfile` and dump every run to its own
+    `{name}-{tick}.pstats` file in `output_dir`. The files can be read with `pstats` or `snakeviz`, or turned into
+    flamegraphs with tools like `flameprof`. Later runs call the body directly.
+
+    Args:
+        output_dir (str): the directory of the `.pstats` files, created if it does not exist.
+        n_ticks (int): the number of runs to profile per plugin. Defaults to 10.
+    """
+
+    def __init__(self, output_dir: str, n_ticks: int = 10):
+        assert n_ticks > 0, ValueError("`n_ticks` must be positive")
+        self.output_dir = output_dir
+        self.n_ticks = n_ticks
+        os.makedirs(output_dir, exist_ok=True)
+
+    def wrap(self, func: Callable, name: str) -> Callable:
+        """Profile `func` as the plugin `name`."""
+        prefix = re.sub(r"[^\w.-]", "_", name)
+        lock = threading.Lock()
+        ticks = [0]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with lock:
+                tick = ticks[0]
+                ticks[0] += 1
+            if tick >= self.n_ticks:
+                return func(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            tic = time.perf_counter()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                path = os.path.join(self.output_dir, f"{prefix}-{tick:04d}.pstats")
+                profile.dump_stats(path)
+                log.info(
+                    f"profiled {name} run {tick + 1}/{self.n_ticks} in"
+                    f" {time.perf_counter() - tic:.3f} sec to {path}"
+                )
+
+        return wrapper
+
+
+# set by the `--profile` option of the CLI, used by plugins without a `profile` of their own
+_default_profiler: Optional[Profiler] = None
+
+
+def set_default_profiler(profiler: Optional[Profiler]):
+    global _default_profiler
+    _default_profiler = profiler
+
+
+def get_profiler(profile: Union[str, Profiler, None]) -> Optional[Profiler]:
+    """
+    Get a profiler from a plugin argument.
+
+    Args:
+        profile (Union[str, Profiler, None]): a `Profiler`, a directory to profile the first 10 runs to,
+            or None for the profiler set by the `--profile` CLI option, if any.
+
+    Returns:
+        The profiler, or None.
+    """
+    if profile is None:
+        return _default_profiler
+    if isinstance(profile, Profiler):
+        return profile
+    return Profiler(str(profile))
+
+
+def profiled(profile: Union[str, Profiler, None], name: str) -> Callable:
+    """
+    Decorate a plugin body to profile its runs, see `Profiler`. Without a profiler the body is returned
+    untouched, so profiling adds no overhead when disabled.
+
+    Args:
+        profile (Union[str, Profiler, None]): the `profile` argument of the plugin, see `get_profiler`.
+        name (str): the name of the plugin, used as prefix of the `.pstats` files.
+    """
+    profiler = get_profiler(profile)
+
+    def decorator(func):
+        if profiler is None:
+            return func
+        return profiler.wrap(func, name)
+
+    return decorator
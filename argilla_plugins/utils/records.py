@@ -0,0 +1,409 @@
+import datetime
+import functools
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import argilla as rg
+import numpy as np
+from argilla.client import api
+
+RECORD_FIELDS = (
+    "id",
+    "text",
+    "inputs",
+    "tokens",
+    "annotation",
+    "annotation_agent",
+    "prediction",
+    "prediction_agent",
+    "multi_label",
+    "event_timestamp",
+    "last_updated",
+    "metadata",
+    "vectors",
+    "status",
+)
+
+
+class LightRecord:
+    """
+    A compact, read-mostly record holding only the projected fields of an Argilla record.
+
+    Fields that were not requested are set to `None`. `annotation` and `prediction` follow the
+    same formats as the Argilla client records, i.e. `[(label, score)]` for text classification
+    and `[(label, start, end, score)]` for token classification.
+    """
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, **fields):
+        for field in RECORD_FIELDS:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    def from_raw(cls, raw: dict) -> "LightRecord":
+        """Build a `LightRecord` from a raw record as returned by the Argilla search API."""
+        inputs = raw.get("inputs")
+        text = raw.get("text")
+        if text is None and inputs is not None and len(inputs) == 1 and "text" in inputs:
+            text = inputs["text"]
+
+        event_timestamp = _parse_timestamp(raw.get("event_timestamp"))
+        last_updated = _parse_timestamp(raw.get("last_updated"))
+
+        multi_label = raw.get("multi_label")
+        annotation = _parse_annotation(raw.get("annotation"), with_score=False)
+        if annotation and "labels" in raw["annotation"] and not multi_label:
+            annotation = annotation[0]
+
+        vectors = raw.get("vectors")
+        if vectors:
+            vectors = {name: vector["value"] for name, vector in vectors.items()}
+
+        return cls(
+            id=raw.get("id"),
+            text=text,
+            inputs=inputs,
+            tokens=raw.get("tokens"),
+            annotation=annotation,
+            annotation_agent=(raw.get("annotation") or {}).get("agent"),
+            prediction=_parse_annotation(raw.get("prediction"), with_score=True),
+            prediction_agent=(raw.get("prediction") or {}).get("agent"),
+            multi_label=multi_label,
+            event_timestamp=event_timestamp,
+            last_updated=last_updated,
+            metadata=raw.get("metadata"),
+            vectors=vectors,
+            status=raw.get("status"),
+        )
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}"
+            for field in RECORD_FIELDS
+            if getattr(self, field) is not None
+        )
+        return f"{self.__class__.__name__}({fields})"
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime.datetime]:
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def _parse_annotation(value: Optional[dict], with_score: bool) -> Optional[list]:
+    """Flatten a raw text or token classification annotation into the client tuple format."""
+    if not value:
+        return None
+    if "labels" in value:
+        if with_score:
+            return [(label["class"], label.get("score")) for label in value["labels"]]
+        return [label["class"] for label in value["labels"]]
+    if "entities" in value:
+        if with_score:
+            return [
+                (ent["label"], ent["start"], ent["end"], ent.get("score"))
+                for ent in value["entities"]
+            ]
+        return [(ent["label"], ent["start"], ent["end"]) for ent in value["entities"]]
+    return None
+
+
+def _projection(fields: Iterable[str]) -> set:
+    fields = set(fields) | {"id"}
+    unknown = fields - set(RECORD_FIELDS)
+    assert not unknown, ValueError(f"unknown record fields {sorted(unknown)}")
+    # text classification records store their text under `inputs`
+    if "text" in fields:
+        fields.add("inputs")
+    # agents are part of the annotation and prediction
+    for agent, field in [
+        ("annotation_agent", "annotation"),
+        ("prediction_agent", "prediction"),
+    ]:
+        if agent in fields:
+            fields.discard(agent)
+            fields.add(field)
+    # `multi_label` is needed to format text classification annotations
+    if "annotation" in fields:
+        fields.add("multi_label")
+    return fields
+
+
+def load_records(
+    name: str,
+    fields: Iterable[str],
+    query: str = None,
+    limit: int = None,
+    id_from: str = None,
+) -> List[LightRecord]:
+    """
+    Load records from a dataset, fetching only the requested fields.
+
+    Args:
+        name (str): the name of the dataset.
+        fields (Iterable[str]): the record fields to fetch, `id` is always included.
+        query (str): a query string to filter the records.
+        limit (int): the maximum number of records to fetch.
+        id_from (str): start fetching after this record id.
+
+    Returns:
+        A list of `LightRecord`s sorted by id.
+    """
+    raw_records = api.active_api().datasets.scan(
+        name=name,
+        projection=_projection(fields),
+        limit=limit,
+        id_from=id_from,
+        query_text=query,
+    )
+    records = [LightRecord.from_raw(raw) for raw in raw_records]
+    try:
+        return sorted(records, key=lambda rec: rec.id)
+    except TypeError:
+        return sorted(records, key=lambda rec: str(rec.id))
+
+
+def load_page(
+    name: str,
+    query: str = None,
+    limit: int = 1000,
+    id_from: str = None,
+    keep: Callable[[Any], bool] = None,
+) -> Tuple[list, Optional[Any]]:
+    """
+    Load a page of full records sorted by id, so a query can be streamed instead of materialized.
+
+    Args:
+        name (str): the name of the dataset.
+        query (str): a query string to filter the records.
+        limit (int): the number of records per page.
+        id_from (str): start fetching after this record id.
+        keep (Callable): if given, only ids are fetched for the page and full records are loaded
+            for the ids it keeps.
+
+    Returns:
+        The records of the page and the id to continue from, None when this was the last page.
+    """
+    if keep is None:
+        records = list(rg.load(name=name, query=query, limit=limit, id_from=id_from))
+        ids = [rec.id for rec in records]
+    else:
+        ids = [
+            rec.id
+            for rec in load_records(name, ["id"], query=query, limit=limit, id_from=id_from)
+        ]
+        kept_ids = [rec_id for rec_id in ids if keep(rec_id)]
+        records = list(rg.load(name=name, ids=kept_ids)) if kept_ids else []
+    next_id = ids[-1] if len(ids) == limit else None
+    return records, next_id
+
+
+class RecordBatch:
+    """
+    A columnar view over a list of records, so plugins can count, sort and threshold with numpy.
+
+    Label columns are indexed by `labels`. For token classification records the entity label
+    is used as label and the entity score as score.
+
+    Attributes:
+        ids (np.ndarray): the record ids.
+        text (np.ndarray): the record texts.
+        event_timestamp (np.ndarray): the event timestamps as `datetime64`, `NaT` if missing.
+        labels (list): the sorted label names found in annotations and predictions.
+        annotation_matrix (np.ndarray): boolean matrix (records x labels) of annotated labels.
+        scores (np.ndarray): float matrix (records x labels) of predicted scores, `nan` if missing.
+        multi_label (bool): whether the records are multi-label.
+        records (list): the records the batch was built from.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        text: np.ndarray,
+        event_timestamp: np.ndarray,
+        labels: List[str],
+        annotation_matrix: np.ndarray,
+        scores: np.ndarray,
+        multi_label: bool = False,
+        records: List[Any] = None,
+    ):
+        self.ids = ids
+        self.text = text
+        self.event_timestamp = event_timestamp
+        self.labels = labels
+        self.annotation_matrix = annotation_matrix
+        self.scores = scores
+        self.multi_label = multi_label
+        self.records = records
+
+    @classmethod
+    def from_records(
+        cls, records: Sequence[Any], labels: List[str] = None
+    ) -> "RecordBatch":
+        """
+        Build a batch from Argilla client records or `LightRecord`s.
+
+        Args:
+            records (Sequence): the records.
+            labels (list): the label names to use as columns, inferred from the records if None.
+        """
+        annotations = [_as_list(getattr(rec, "annotation", None)) for rec in records]
+        predictions = [_as_list(getattr(rec, "prediction", None)) for rec in records]
+        if labels is None:
+            labels = sorted(
+                {_label(item) for items in annotations + predictions for item in items},
+                key=str,
+            )
+        label_idx = {label: idx for idx, label in enumerate(labels)}
+
+        annotation_matrix = np.zeros((len(records), len(labels)), dtype=bool)
+        scores = np.full((len(records), len(labels)), np.nan)
+        for row, (annotation, prediction) in enumerate(zip(annotations, predictions)):
+            for item in annotation:
+                col = label_idx.get(_label(item))
+                if col is not None:
+                    annotation_matrix[row, col] = True
+            for item in prediction:
+                col = label_idx.get(_label(item))
+                if col is None:
+                    continue
+                score = item[-1] if isinstance(item, (tuple, list)) else None
+                score = np.nan if score is None else score
+                scores[row, col] = np.fmax(scores[row, col], score)
+
+        event_timestamp = np.array(
+            [
+                np.datetime64(rec.event_timestamp, "us")
+                if getattr(rec, "event_timestamp", None) is not None
+                else np.datetime64("NaT", "us")
+                for rec in records
+            ],
+            dtype="datetime64[us]",
+        )
+
+        return cls(
+            ids=_object_array([rec.id for rec in records]),
+            text=_object_array([rec.text for rec in records]),
+            event_timestamp=event_timestamp,
+            labels=list(labels),
+            annotation_matrix=annotation_matrix,
+            scores=scores,
+            multi_label=any(getattr(rec, "multi_label", False) for rec in records),
+            records=list(records),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, indices: Union[np.ndarray, List[int]]) -> "RecordBatch":
+        """Select rows by position or boolean mask, keeping the column order."""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        return self.__class__(
+            ids=self.ids[indices],
+            text=self.text[indices],
+            event_timestamp=self.event_timestamp[indices],
+            labels=self.labels,
+            annotation_matrix=self.annotation_matrix[indices],
+            scores=self.scores[indices],
+            multi_label=self.multi_label,
+            records=[self.records[idx] for idx in indices]
+            if self.records is not None
+            else None,
+        )
+
+    def argsort(self, column: str, reverse: bool = False) -> np.ndarray:
+        """Stable argsort on a one-dimensional column like `event_timestamp`."""
+        order = np.argsort(getattr(self, column), kind="stable")
+        if reverse:
+            order = order[::-1]
+        return order
+
+    @property
+    def label_codes(self) -> np.ndarray:
+        """The annotated label index per record, -1 if the record is not annotated."""
+        if not self.labels:
+            return np.full(len(self), -1)
+        return np.where(
+            self.annotation_matrix.any(axis=1), self.annotation_matrix.argmax(axis=1), -1
+        )
+
+    def label_counts(self) -> Dict[str, int]:
+        """The number of annotated records per label."""
+        counts = self.annotation_matrix.sum(axis=0)
+        return {label: int(count) for label, count in zip(self.labels, counts)}
+
+    def max_scores(self) -> np.ndarray:
+        """The highest predicted score per record, `nan` if the record has no prediction."""
+        if not self.labels:
+            return np.full(len(self), np.nan)
+        return np.fmax.reduce(self.scores, axis=1)
+
+
+def _as_list(value: Any) -> list:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _label(item: Any) -> Any:
+    return item[0] if isinstance(item, (tuple, list)) else item
+
+
+def get_labels(value: Any) -> tuple:
+    """
+    Get the labels of an annotation or prediction in any of the client formats, e.g. `"label"`,
+    `["label"]`, `[("label", score)]` or `[("label", start, end)]`.
+    """
+    return tuple(_label(item) for item in _as_list(value))
+
+
+def _object_array(values: list) -> np.ndarray:
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def with_fields(fields: Union[List[str], tuple], as_batch: bool = False) -> Callable:
+    """
+    Decorate a plugin body so it receives projected `LightRecord`s instead of full records.
+
+    Use it together with `listener(..., with_records=False)`. The records are fetched with the
+    formatted listener query. When records are passed explicitly, e.g. `plugin.action(records, ctx)`,
+    they are forwarded untouched.
+
+    Args:
+        fields (list): the record fields the plugin needs.
+        as_batch (bool): if True, the records are handed over as a columnar `RecordBatch`.
+    """
+    fields = _projection(fields)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            if len(args) == 1:
+                ctx = args[0]
+                records = load_records(ctx.__listener__.dataset, fields, query=ctx.query)
+            else:
+                records, ctx = args
+            if as_batch and not isinstance(records, RecordBatch):
+                records = RecordBatch.from_records(records)
+            return func(records, ctx)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from typing import Any, Callable, Iterable, List, Optional
+
+import argilla as rg
+
+from argilla_plugins.utils.records import load_records
+
+
+def shard_of(key: Any, n_shards: int) -> int:
+    """A stable shard for a key, the same across processes and nodes unlike `hash`."""
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % n_shards
+
+
+class ShardCoordinator:
+    """
+    Split the records of a dataset over workers by a stable hash of their id, or another key.
+
+    Either pin the worker to `shard_index`, or let workers sharing a `lease_path` claim a free shard from a
+    SQLite lease table. Leases are renewed on every run and expire after `lease_ttl_in_seconds`, so the shard
+    of a worker that died is taken over by the next worker that starts. Runs that may take longer than the
+    lease must `renew` it along the way.
+
+    Args:
+        n_shards (int): the number of shards, usually the number of workers.
+        shard_index (int): the shard of this worker. Defaults to None, claim one from `lease_path`.
+        lease_path (str): the path of the SQLite lease database shared by the workers.
+        lease_ttl_in_seconds (float): the number of seconds a lease stays valid without renewal. Defaults to 300.
+        owner (str): the name of this worker. Defaults to "{hostname}:{pid}:{random}".
+    """
+
+    def __init__(
+        self,
+        n_shards: int,
+        shard_index: int = None,
+        lease_path: str = None,
+        lease_ttl_in_seconds: float = 300,
+        owner: str = None,
+    ):
+        assert n_shards > 0, ValueError("`n_shards` must be positive")
+        assert (shard_index is None) != (lease_path is None), ValueError(
+            "provide either a `shard_index` or a `lease_path`"
+        )
+        if shard_index is not None:
+            assert 0 <= shard_index < n_shards, ValueError(
+                "`shard_index` must be between 0 and `n_shards` - 1"
+            )
+        self.n_shards = n_shards
+        self.shard_index = shard_index
+        self.lease_path = lease_path
+        self.lease_ttl_in_seconds = lease_ttl_in_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        if lease_path is not None:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS leases"
+                    " (shard INTEGER PRIMARY KEY, owner TEXT, expires REAL)"
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode, transactions are started explicitly
+        return sqlite3.connect(self.lease_path, timeout=30, isolation_level=None)
+
+    def acquire(self) -> Optional[int]:
+        """Claim or renew the shard of this worker, None if all shards are leased by other workers."""
+        if self.lease_path is None:
+            return self.shard_index
+
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT shard FROM leases WHERE owner = ?", (self.owner,)
+                ).fetchone()
+                if row is not None and row[0] < self.n_shards:
+                    shard = row[0]
+                else:
+                    taken = {
+                        shard
+                        for shard, in conn.execute(
+                            "SELECT shard FROM leases WHERE expires > ? AND owner != ?",
+                            (now, self.owner),
+                        )
+                    }
+                    free = [shard for shard in range(self.n_shards) if shard not in taken]
+                    shard = free[0] if free else None
+                if shard is not None:
+                    conn.execute("DELETE FROM leases WHERE owner = ?", (self.owner,))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO leases (shard, owner, expires) VALUES (?, ?, ?)",
+                        (shard, self.owner, now + self.lease_ttl_in_seconds),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        self.shard_index = shard
+        return shard
+
+    def renew(self) -> bool:
+        """
+        Renew the lease of the current shard during a long run, False if the shard was lost, e.g. because the
+        lease expired and another worker took it over. Stop processing the shard when it was lost.
+        """
+        shard = self.shard_index
+        return shard is not None and self.acquire() == shard
+
+    def release(self):
+        """Release the lease of this worker so another worker can take over its shard."""
+        if self.lease_path is None:
+            return
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM leases WHERE owner = ?", (self.owner,))
+        self.shard_index = None
+
+    def owns(self, key: Any) -> bool:
+        """Whether the key belongs to the current shard of this worker."""
+        return self.shard_index is not None and shard_of(key, self.n_shards) == self.shard_index
+
+    def filter(self, records: Iterable[Any], key: Callable[[Any], Any] = None) -> List[Any]:
+        """Keep the records of the current shard, by record id unless a `key` is given."""
+        key = key or (lambda rec: rec.id)
+        return [rec for rec in records if self.owns(key(rec))]
+
+
+def load_shard(
+    name: str,
+    sharding: ShardCoordinator,
+    query: str = None,
+    batch_size: int = 1000,
+) -> list:
+    """
+    Load the full records of the current shard. Only ids are fetched for the whole query, the full
+    records are then loaded by id for the shard only.
+    """
+    ids = [rec.id for rec in sharding.filter(load_records(name, ["id"], query=query))]
+    records = []
+    for i in range(0, len(ids), batch_size):
+        records.extend(rg.load(name=name, ids=ids[i : i + batch_size]))
+    return records
+
@@ -0,0 +1,132 @@
+import os
+import pickle
+import re
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import closing
+from typing import Any, Dict, Optional, Union
+
+
+class StateStore(ABC):
+    """
+    A local store that plugins use to persist their state, like cursors, models and KBs, so a restarted
+    listener resumes where it stopped. The state of a plugin is a dict saved and loaded as a whole under a key,
+    e.g. "classy_learner/my-dataset", so a save is atomic.
+
+    State is pickled, only load stores you created yourself.
+    """
+
+    @abstractmethod
+    def load(self, key: str) -> Dict[str, Any]:
+        """Load the state saved under `key`, an empty dict if there is none."""
+        ...
+
+    @abstractmethod
+    def save(self, key: str, state: Dict[str, Any]):
+        """Atomically replace the state saved under `key`."""
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Delete the state saved under `key`, if any."""
+        ...
+
+
+class FileStateStore(StateStore):
+    """
+    Store every key as a pickle file in a directory. Files are written to a temporary file first and
+    then moved into place, so a crash never leaves a partially written state.
+
+    Args:
+        path (str): the directory of the store, created if it does not exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, re.sub(r"[^\w.-]", "_", key) + ".pkl")
+
+    def load(self, key: str) -> Dict[str, Any]:
+        try:
+            with open(self._file(key), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, key: str, state: Dict[str, Any]):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._file(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Store every key as a row in a SQLite database, each save is a single transaction.
+
+    Args:
+        path (str): the path of the database file, created if it does not exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, key: str) -> Dict[str, Any]:
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row else {}
+
+    def save(self, key: str, state: Dict[str, Any]):
+        value = pickle.dumps(state)
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def delete(self, key: str):
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+
+def get_state_store(
+    state_store: Union[str, StateStore, None]
+) -> Optional[StateStore]:
+    """
+    Get a state store from a plugin argument.
+
+    Args:
+        state_store (Union[str, StateStore, None]): a `StateStore`, a path ending in ".db" or ".sqlite"
+            for a `SQLiteStateStore`, any other path for a `FileStateStore`, or None for no store.
+
+    Returns:
+        The state store, or None.
+    """
+    if state_store is None or isinstance(state_store, StateStore):
+        return state_store
+    if str(state_store).endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLiteStateStore(str(state_store))
+    return FileStateStore(str(state_store))
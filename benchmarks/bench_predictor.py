@@ -0,0 +1,67 @@
+"""
+Benchmarks for the `predictor` plugin helpers.
+
+Run from the repository root with `python -m benchmarks.bench_predictor`. The model benchmark only runs
+when `transformers` is installed.
+"""
+import importlib.util
+import random
+import time
+
+from argilla_plugins.inference.predictor import DynamicBatcher, load_pipeline
+
+
+def padded_model(texts, seconds_per_char: float = 1e-6):
+    """A fake model whose cost grows with the padded batch size, like a transformer."""
+    time.sleep(len(texts) * max(len(text) for text in texts) * seconds_per_char)
+    return [len(text) for text in texts]
+
+
+def make_texts(n_texts: int, seed: int = 42):
+    rng = random.Random(seed)
+    return ["x" * rng.choice([20, 50, 200, 1000]) for _ in range(n_texts)]
+
+
+def bench_dynamic_batching(n_texts: int = 2_000, batch_size: int = 32):
+    print("dynamic batching")
+    texts = make_texts(n_texts)
+
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        padded_model(texts[i : i + batch_size])
+    seconds = time.perf_counter() - start
+    print(f"  fixed batches          {n_texts / seconds:10.1f} records/sec")
+
+    for max_latency_in_seconds in [None, 0.005]:
+        batcher = DynamicBatcher(batch_size, max_latency_in_seconds=max_latency_in_seconds)
+        start = time.perf_counter()
+        outputs = batcher(padded_model, texts)
+        seconds = time.perf_counter() - start
+        assert outputs == [len(text) for text in texts]
+        print(
+            f"  dynamic latency={str(max_latency_in_seconds):<6} {n_texts / seconds:10.1f}"
+            f" records/sec, final batch size {batcher.batch_size}"
+        )
+
+
+def bench_model(n_texts: int = 512, batch_size: int = 32):
+    if importlib.util.find_spec("transformers") is None:
+        print("model: skipped, `transformers` is not installed")
+        return
+    print("model")
+    rng = random.Random(0)
+    words = ["good", "bad", "movie", "plot", "actor", "great", "boring", "the", "a"]
+    texts = [" ".join(rng.choices(words, k=rng.randint(5, 60))) for _ in range(n_texts)]
+    model = "distilbert-base-uncased-finetuned-sst-2-english"
+    for quantize in [False, True]:
+        pipe = load_pipeline(model, "text-classification", quantize=quantize)
+        batcher = DynamicBatcher(batch_size)
+        start = time.perf_counter()
+        batcher(lambda batch: pipe(batch, batch_size=len(batch)), texts)
+        seconds = time.perf_counter() - start
+        print(f"  quantize={str(quantize):<6} {n_texts / seconds:10.1f} records/sec")
+
+
+if __name__ == "__main__":
+    bench_dynamic_batching()
+    bench_model()
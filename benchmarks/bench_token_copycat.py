@@ -0,0 +1,208 @@
+"""
+Benchmarks for the `token_copycat` helpers.
+
+Run from the repository root with `python -m benchmarks.bench_token_copycat`.
+"""
+import copy
+import bisect
+import itertools
+import random
+import re
+import time
+import timeit
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import argilla as rg
+
+from argilla_plugins.programmatic_labelling.token_copycat import (
+    _copy_spans_batch,
+    WordIndex,
+    _init_worker,
+    apply_word_dict_kb,
+    copy_spans,
+    resolve_span_overlap,
+    token_offsets,
+)
+
+
+def make_spans(n_spans: int, text_length: int, max_span_length: int, seed: int = 42):
+    rng = random.Random(seed)
+    spans = []
+    for _ in range(n_spans):
+        start = rng.randrange(text_length - max_span_length)
+        end = start + rng.randint(1, max_span_length)
+        spans.append(("LABEL", start, end, 0.0))
+    return spans
+
+
+def bench_resolve_span_overlap(number: int = 20):
+    print("resolve_span_overlap")
+    for n_spans, text_length, max_span_length in [
+        (1_000, 10_000, 20),
+        (5_000, 50_000, 20),
+        (5_000, 50_000, 500),
+    ]:
+        spans = make_spans(n_spans, text_length, max_span_length)
+        seconds = timeit.timeit(lambda: resolve_span_overlap(spans), number=number) / number
+        print(f"  spans={n_spans:<6} max_len={max_span_length:<4} {seconds * 1000:8.2f} ms")
+
+
+def make_records(n_records: int, n_words: int, vocabulary: List[str], seed: int = 42):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(n_records):
+        tokens = [rng.choice(vocabulary) for _ in range(n_words)]
+        records.append((" ".join(tokens), tokens, None, None))
+    return records
+
+
+def apply_word_dict_kb_regex(text, offsets, word_dict):
+    """The previous implementation, scanning the text with a regex per KB word."""
+    starts, ends = offsets
+
+    def in_sorted(values, value):
+        idx = bisect.bisect_left(values, value)
+        return idx < len(values) and values[idx] == value
+
+    record_info = []
+    for word, word_info in word_dict.items():
+        for match in re.finditer(re.escape(word), text):
+            start, end = match.span()
+            if in_sorted(starts, start) and in_sorted(ends, end):
+                record_info.append((word_info["label"], start, end, word_info["score"]))
+    return record_info
+
+
+def bench_kb_size(n_records: int = 200):
+    print("KB size")
+    rng = random.Random(0)
+    vocabulary = [f"word{idx}" for idx in range(5_000)]
+    records = make_records(n_records, 50, vocabulary)
+    offsets = [token_offsets(text, tokens) for text, tokens, _, _ in records]
+    for kb_size in [400, 2_000]:
+        kb = {word: {"label": "LABEL", "score": 0.0} for word in rng.sample(vocabulary, kb_size)}
+        for func in [apply_word_dict_kb_regex, apply_word_dict_kb]:
+            start = time.perf_counter()
+            index = kb if func is apply_word_dict_kb_regex else WordIndex(kb)
+            results = [
+                sorted(func(rec[0], rec_offsets, index))
+                for rec, rec_offsets in zip(records, offsets)
+            ]
+            print(
+                f"  {func.__name__:<24} kb={kb_size:<6}"
+                f" {time.perf_counter() - start:6.2f} s"
+            )
+        assert results == [
+            sorted(apply_word_dict_kb_regex(rec[0], rec_offsets, kb))
+            for rec, rec_offsets in zip(records, offsets)
+        ]
+
+
+def bench_copy_spans(n_records: int = 2_000, batch_size: int = 250):
+    print("copy_spans")
+    rng = random.Random(0)
+    vocabulary = [f"word{idx}" for idx in range(2_000)]
+    kb = {word: {"label": "LABEL", "score": 0.0} for word in rng.sample(vocabulary, 200)}
+    kwargs = {
+        "word_dict_kb_predictions": WordIndex(kb),
+        "word_dict_kb_annotations": WordIndex(kb),
+    }
+    records = make_records(n_records, 50, vocabulary)
+
+    start = time.perf_counter()
+    expected = [copy_spans(*rec, **kwargs) for rec in records]
+    print(f"  sequential          {time.perf_counter() - start:8.2f} s")
+
+    for n_jobs in [2, 4]:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_init_worker, initargs=(kwargs,)
+        ) as executor:
+            batches = [
+                records[idx : idx + batch_size]
+                for idx in range(0, len(records), batch_size)
+            ]
+            results = list(
+                itertools.chain.from_iterable(executor.map(_copy_spans_batch, batches))
+            )
+        print(f"  n_jobs={n_jobs:<12} {time.perf_counter() - start:8.2f} s")
+        assert results == expected
+
+
+def update_record_deepcopy(rec, word_index):
+    """The previous update of a record, deep-copying its spans and always resolving them."""
+    rec_predictions_old = copy.deepcopy(rec.prediction)
+    rec_annotations_old = copy.deepcopy(rec.annotation)
+    validated_spans = apply_word_dict_kb(rec.text, token_offsets(rec.text, rec.tokens), word_index)
+    if rec.prediction is None:
+        rec.prediction = []
+    rec.prediction += validated_spans
+    rec.prediction = resolve_span_overlap(rec.prediction)
+    if rec_predictions_old != rec.prediction or rec_annotations_old != rec.annotation:
+        return rec.__class__(**rec.__dict__)
+    return None
+
+
+def update_record(rec, word_index):
+    """The current update of a record, only rebuilding it when `copy_spans` reports a change."""
+    result = copy_spans(
+        rec.text, rec.tokens, rec.prediction, rec.annotation, word_dict_kb_predictions=word_index
+    )
+    if result is not None:
+        rec.prediction, rec.annotation = result
+        return rec.__class__(**rec.__dict__)
+    return None
+
+
+def make_token_records(n_records: int, vocabulary: List[str], kb_word: str = None):
+    """Records with a single predicted span, on `kb_word` if given, so the KB leaves them unchanged."""
+    records = []
+    for text, tokens, _, _ in make_records(n_records, 50, vocabulary):
+        if kb_word is not None:
+            tokens[0] = kb_word
+            text = " ".join(tokens)
+        records.append(
+            rg.TokenClassificationRecord(
+                text=text, tokens=tokens, prediction=[("LABEL", 0, len(tokens[0]), 0.0)]
+            )
+        )
+    return records
+
+
+def bench_change_detection(n_records: int = 2_000):
+    print("change detection of unchanged records")
+    vocabulary = [f"word{idx}" for idx in range(2_000)]
+    # the KB words are not in the vocabulary, so only the first token of a record can match
+    word_index = WordIndex({"kbword": {"label": "LABEL", "score": 0.0}})
+    for case, kb_word in [("no KB match", None), ("already labelled", "kbword")]:
+        for func in [update_record_deepcopy, update_record]:
+            records = make_token_records(n_records, vocabulary, kb_word)
+            changed = sum(func(rec, word_index) is not None for rec in records)
+            seconds = min(
+                timeit.repeat(lambda: [func(rec, word_index) for rec in records], number=1, repeat=5)
+            )
+
+            # allocations of every single update, without the records kept by the benchmark
+            records = make_token_records(n_records, vocabulary, kb_word)
+            allocated = 0
+            tracemalloc.start()
+            for rec in records:
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                func(rec, word_index)
+                allocated += tracemalloc.get_traced_memory()[1] - before
+            tracemalloc.stop()
+            assert changed == 0
+            print(
+                f"  {case:<17} {func.__name__:<23} {seconds * 1000:8.2f} ms"
+                f" {allocated / n_records:8.1f} bytes/record"
+            )
+
+
+if __name__ == "__main__":
+    bench_resolve_span_overlap()
+    bench_kb_size()
+    bench_copy_spans()
+    bench_change_detection()
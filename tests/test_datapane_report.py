@@ -0,0 +1,59 @@
+import datetime
+
+from argilla_plugins.reporting.datapane_report import ReportAggregates
+from argilla_plugins.utils.records import LightRecord
+
+
+def test_report_aggregates_replace_updated_records():
+    aggregates = ReportAggregates(text_length_bin_size=10)
+    records = [
+        LightRecord(id=1, text="short", prediction=[("pos", 0.9), ("neg", 0.1)]),
+        LightRecord(id=2, text="a slightly longer text", prediction=[("neg", 0.8)]),
+    ]
+    assert aggregates.update(records) == 2
+    assert aggregates.n_annotated == 0
+
+    # record 1 gets annotated, record 2 is seen again unchanged
+    records[0] = LightRecord(
+        id=1,
+        text="short",
+        annotation="neg",
+        annotation_agent="annotator",
+        prediction=[("pos", 0.9), ("neg", 0.1)],
+        last_updated=datetime.datetime(2023, 1, 1, 10, 30),
+    )
+    assert aggregates.update(records) == 1
+
+    assert aggregates.n_records == 2
+    assert aggregates.n_annotated == 1
+    assert aggregates.label_counts == {"neg": 1}
+    assert aggregates.agreement[("annotator", False)] == 1
+    assert sum(aggregates.throughput.values()) == 1
+    assert dict(aggregates.text_lengths) == {0: 1, 2: 1}
+
+    frames = aggregates.to_frames()
+    assert frames["Label distribution"].set_index("label")["predictions"].to_dict() == {
+        "neg": 2,
+        "pos": 1,
+    }
+    assert frames["Annotation/prediction agreement"]["agreement"].tolist() == [0.0]
+
+
+def test_report_aggregates_keep_first_annotation_period():
+    aggregates = ReportAggregates(throughput_freq="1h")
+
+    def annotated(label, hour):
+        return LightRecord(
+            id=1,
+            text="Paris",
+            annotation=label,
+            annotation_agent="annotator",
+            last_updated=datetime.datetime(2023, 1, 1, hour),
+        )
+
+    aggregates.update([annotated("LOC", 10)])
+    # re-logged later, e.g. by another plugin, and then re-labelled
+    aggregates.update([annotated("LOC", 12)])
+    aggregates.update([annotated("PER", 14)])
+    assert {period.hour: count for period, count in aggregates.throughput.items() if count} == {10: 1}
+    assert +aggregates.label_counts == {"PER": 1}
@@ -0,0 +1,54 @@
+import json
+
+import argilla as ar
+import pytest
+
+from argilla_plugins.utils.records import LightRecord
+
+pytest.importorskip("great_expectations")
+
+
+def test_great_expectations_report_validates_changed_records_only(tmp_path):
+    from argilla_plugins.reporting import great_expectations_report
+
+    output_path = tmp_path / "validation.json"
+    listener = great_expectations_report(
+        "test-dataset",
+        output_path=str(output_path),
+        allowed_labels=["pos", "neg"],
+        vector_dimensions={"vector": 3},
+    )
+    ctx = ar.RGListenerContext(listener, query_params=listener.query_params)
+    records = [
+        LightRecord(
+            id=1,
+            text="ok",
+            annotation="pos",
+            prediction=[("pos", 0.9)],
+            vectors={"vector": [1, 2, 3]},
+        ),
+        LightRecord(
+            id=2,
+            text="  ",
+            annotation="maybe",
+            prediction=[("neg", 1.5)],
+            vectors={"vector": [1, 2]},
+        ),
+    ]
+    listener.action(records, ctx)
+
+    report = json.loads(output_path.read_text())
+    assert report["n_records"] == 2
+    assert report["n_failed_records"] == 1
+    for expectation in [
+        "text_not_empty",
+        "allowed_labels",
+        "score_range",
+        "vector_dimensions.vector",
+    ]:
+        assert report["expectations"][expectation]["failed_record_ids"] == [2]
+
+    # unchanged records are not validated again
+    output_path.unlink()
+    listener.action(records, ctx)
+    assert not output_path.exists()
@@ -0,0 +1,62 @@
+import copy
+import threading
+
+from argilla_plugins.active_learning.hot_swap import HotSwapModel
+
+
+def test_current_version_serves_while_training():
+    started, release = threading.Event(), threading.Event()
+    swaps = []
+
+    def fit(model, data):
+        started.set()
+        release.wait(5)
+        return f"model on {data}"
+
+    hot_swap = HotSwapModel(
+        model="model on a", data="a", on_swap=lambda *swap: swaps.append(swap)
+    )
+    assert not hot_swap.submit("a", fit)
+    assert hot_swap.submit("b", fit)
+    started.wait(5)
+    # the current version keeps serving and no second version starts training
+    assert hot_swap.current == ("model on a", 0)
+    assert not hot_swap.submit("c", fit)
+
+    release.set()
+    hot_swap.wait(5)
+    assert hot_swap.current == ("model on b", 1)
+    assert swaps == [("model on b", 1, "b")]
+    assert not hot_swap.submit("b", fit)
+    assert hot_swap.submit("c", fit)
+    hot_swap.wait(5)
+    assert hot_swap.current == ("model on c", 2)
+
+
+def test_first_model_keeps_version_and_failures_are_retried():
+    def fail(model, data):
+        raise RuntimeError("out of memory")
+
+    hot_swap = HotSwapModel(idx=3)
+    assert hot_swap.submit("a", fail)
+    hot_swap.wait(5)
+    assert hot_swap.current == (None, 3)
+
+    assert hot_swap.submit("a", lambda model, data: f"model on {data}")
+    hot_swap.wait(5)
+    assert hot_swap.current == ("model on a", 3)
+
+
+def test_deep_copies_share_the_model_and_training_survives_shutdown():
+    hot_swap = HotSwapModel(model="model on a", data="a")
+    query_params = copy.deepcopy({"classy_classifier": hot_swap})
+    assert query_params["classy_classifier"] is hot_swap
+
+    assert hot_swap.submit("b", lambda model, data: f"model on {data}")
+    hot_swap.shutdown()
+    assert hot_swap.current == ("model on b", 1)
+    # a later run starts a new training thread
+    assert hot_swap.submit("c", lambda model, data: f"model on {data}")
+    hot_swap.wait(5)
+    assert hot_swap.current == ("model on c", 2)
+    hot_swap.shutdown()
@@ -0,0 +1,104 @@
+import pickle
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from argilla_plugins.active_learning.classy_learner import _most_recent, _with_sample
+from argilla_plugins.utils.memory import LRUDict, deep_sizeof, parse_memory_budget
+from argilla_plugins.utils.records import LightRecord, RecordBatch
+
+
+@pytest.mark.parametrize(
+    "memory_budget, expected",
+    [(None, None), (1024, 1024), ("1KB", 1024), ("1.5 mb", 1536 * 1024), ("2G", 2 * 1024**3)],
+)
+def test_parse_memory_budget(memory_budget, expected):
+    assert parse_memory_budget(memory_budget) == expected
+
+
+def test_parse_memory_budget_invalid():
+    with pytest.raises(ValueError):
+        parse_memory_budget("a lot")
+
+
+def test_deep_sizeof_counts_nested_values():
+    assert deep_sizeof({"word": "x" * 1000}) > deep_sizeof({"word": "x"}) + 900
+
+
+def test_lru_dict_evicts_least_recently_used():
+    kb = LRUDict(max_bytes=3, sizeof=lambda key, value: 1)
+    kb["a"], kb["b"], kb["c"] = 1, 2, 3
+    # reading "a" makes "b" the least recently used entry
+    assert kb["a"] == 1
+    kb["d"] = 4
+    assert list(kb) == ["c", "a", "d"]
+    assert kb.nbytes == 3
+    assert kb.n_evicted == 1
+
+
+def test_lru_dict_pickle():
+    kb = LRUDict({"Paris": "LOC", "Jane": "PER"}, max_bytes=10**6)
+    kb["Paris"]
+    restored = pickle.loads(pickle.dumps(kb))
+    assert list(restored.items()) == [("Jane", "PER"), ("Paris", "LOC")]
+    assert restored.max_bytes == kb.max_bytes
+    assert restored.nbytes == kb.nbytes
+
+
+def _records(n):
+    start = datetime(2023, 1, 1)
+    return [
+        LightRecord(
+            id=idx,
+            text=f"text {idx}",
+            annotation=["positive", "negative", "neutral"][idx % 3],
+            # ties on the timestamp must be broken by id
+            event_timestamp=start + timedelta(minutes=(idx * 7) % 5),
+        )
+        for idx in range(n)
+    ]
+
+
+@pytest.mark.parametrize("memory_budget", [10**9, 1])
+@pytest.mark.parametrize("reverse", [False, True])
+def test_with_sample_matches_full_load(mocker, reverse, memory_budget):
+    records = _records(50)
+
+    def load_records(name, fields, query=None, limit=None, id_from=None):
+        start = 0 if id_from is None else id_from + 1
+        return records[start : start + limit]
+
+    mocker.patch(
+        "argilla_plugins.active_learning.classy_learner.load_records", load_records
+    )
+    ctx = SimpleNamespace(
+        __listener__=SimpleNamespace(dataset="test-dataset"),
+        query="annotated_as: *",
+        query_params={"page_size": 7},
+    )
+
+    def texts_per_label(batch, ctx):
+        batch = batch.take(batch.argsort("event_timestamp", reverse=reverse))
+        return {
+            label: list(batch.text[batch.annotation_matrix[:, col]][:4])
+            for col, label in enumerate(batch.labels)
+        }
+
+    sampled = _with_sample(
+        _most_recent(4, reverse), memory_budget=memory_budget, log=mocker.Mock()
+    )
+    assert sampled(texts_per_label)(ctx) == texts_per_label(
+        RecordBatch.from_records(records), ctx
+    )
+
+
+def test_lru_dict_without_budget_skips_sizing():
+    def sizeof(key, value):
+        raise AssertionError("sized without a budget")
+
+    kb = LRUDict({"a": 1}, sizeof=sizeof)
+    kb["b"] = 2
+    del kb["a"]
+    assert list(kb.items()) == [("b", 2)]
+    assert kb.nbytes == 0
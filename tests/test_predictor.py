@@ -0,0 +1,39 @@
+import importlib
+
+from argilla_plugins.inference.predictor import DynamicBatcher, predictor
+
+# `argilla_plugins.inference.predictor` is shadowed by the plugin function of the same name
+predictor_module = importlib.import_module("argilla_plugins.inference.predictor")
+
+
+def test_dynamic_batcher_keeps_input_order():
+    texts = ["ccc", "a", "bb", "dddd", "a"]
+    batch_sizes = []
+
+    def func(batch):
+        batch_sizes.append(len(batch))
+        return [text.upper() for text in batch]
+
+    batcher = DynamicBatcher(max_batch_size=2)
+    assert batcher(func, texts) == ["CCC", "A", "BB", "DDDD", "A"]
+    assert batch_sizes == [2, 2, 1]
+
+
+def test_dynamic_batcher_adapts_to_latency_budget():
+    batcher = DynamicBatcher(max_batch_size=8, max_latency_in_seconds=1.0)
+    batcher._adapt(2.0)
+    assert batcher.batch_size == 4
+    batcher._adapt(2.0)
+    assert batcher.batch_size == 2
+    batcher._adapt(0.1)
+    assert batcher.batch_size == 4
+
+
+def test_overwrite_predictions_skips_records_predicted_by_the_model(mocker):
+    mocker.patch.object(predictor_module, "load_pipeline")
+    plugin = predictor("dataset", query="status: Default", model="my-model", overwrite_predictions=True)
+    # argilla indexes the prediction agent as `predicted_by`
+    assert plugin.query == '(status: Default) AND NOT annotated_as: * AND NOT predicted_by: "my-model"'
+
+    plugin = predictor("dataset", model="my-model")
+    assert plugin.query == "NOT annotated_as: * AND NOT predicted_as: *"
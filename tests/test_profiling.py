@@ -0,0 +1,67 @@
+import pstats
+
+import typer
+from argilla.listeners import RGDatasetListener
+from argilla.listeners.models import RGListenerContext
+from typer.testing import CliRunner
+
+from argilla_plugins.utils import profiling, records
+from argilla_plugins.utils.cli_tools import app
+from argilla_plugins.utils.profiling import Profiler, get_profiler, profiled
+
+
+def test_profiled_dumps_stats_for_the_first_ticks(tmp_path):
+    def plugin(records, ctx):
+        return sum(records)
+
+    wrapped = profiled(Profiler(str(tmp_path), n_ticks=2), "embedder-test/dataset")(plugin)
+    assert [wrapped([1, 2], None) for _ in range(3)] == [3, 3, 3]
+
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert files == ["embedder-test_dataset-0000.pstats", "embedder-test_dataset-0001.pstats"]
+    stats = pstats.Stats(str(tmp_path / files[0]))
+    assert any(func[2] == "plugin" for func in stats.stats)
+
+
+def test_profiled_is_a_no_op_when_disabled(monkeypatch):
+    monkeypatch.setattr(profiling, "_default_profiler", None)
+
+    def plugin(records, ctx):
+        pass
+
+    assert profiled(None, "embedder-test")(plugin) is plugin
+
+
+def test_cli_profile_option_sets_default_profiler(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_default_profiler", None)
+    result = CliRunner().invoke(
+        app,
+        ["--profile", str(tmp_path), "--profile-ticks", "3", "end-of-life", "--help"],
+    )
+    assert result.exit_code == 0, result.output
+
+    profiler = get_profiler(None)
+    assert profiler.output_dir == str(tmp_path)
+    assert profiler.n_ticks == 3
+
+
+def test_cli_command_starts_a_profiled_listener(tmp_path, monkeypatch, mocker):
+    monkeypatch.setattr(profiling, "_default_profiler", None)
+    mocker.patch.object(records, "load_records", return_value=[])
+
+    def start(self):
+        # a single run instead of the scheduler thread
+        self.__run_action__(RGListenerContext(listener=self, query_params=self.query_params))
+
+    mocker.patch.object(RGDatasetListener, "start", start)
+    result = CliRunner().invoke(
+        app,
+        ["--profile", str(tmp_path), "end-of-life", "plugin-test", "--end-of-life-in-seconds", "100"],
+    )
+    assert result.exit_code == 0, result.output
+    assert [path.name for path in tmp_path.iterdir()] == ["end_of_life-plugin-test-0000.pstats"]
+
+
+def test_cli_commands_leave_python_objects_out_of_the_options():
+    command = typer.main.get_command(app).commands["remove-duplicate"]
+    assert [param.name for param in command.params] == ["name", "query", "discard_only"]
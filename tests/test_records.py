@@ -0,0 +1,79 @@
+import datetime
+
+import numpy as np
+
+from argilla_plugins.utils.records import LightRecord, RecordBatch, _projection
+
+
+def test_light_record_from_raw_text_classification():
+    raw = {
+        "id": 1,
+        "inputs": {"text": "Egg"},
+        "multi_label": False,
+        "annotation": {"agent": "argilla", "labels": [{"class": "food", "score": 1.0}]},
+        "prediction": {"agent": "model", "labels": [{"class": "food", "score": 0.8}]},
+        "event_timestamp": "2023-01-01T10:00:00",
+        "vectors": {"vector": {"value": [0.1, 0.2]}},
+    }
+    rec = LightRecord.from_raw(raw)
+    assert rec.id == 1
+    assert rec.text == "Egg"
+    assert rec.annotation == "food"
+    assert rec.prediction == [("food", 0.8)]
+    assert rec.event_timestamp.year == 2023
+    assert rec.vectors == {"vector": [0.1, 0.2]}
+    assert rec.tokens is None
+    assert not hasattr(rec, "__dict__")
+
+
+def test_light_record_from_raw_token_classification():
+    raw = {
+        "id": "a",
+        "text": "Egg and Potato",
+        "tokens": ["Egg", "and", "Potato"],
+        "annotation": {"entities": [{"label": "FOOD", "start": 0, "end": 3}]},
+    }
+    rec = LightRecord.from_raw(raw)
+    assert rec.text == "Egg and Potato"
+    assert rec.annotation == [("FOOD", 0, 3)]
+    assert rec.prediction is None
+
+
+def test_projection_adds_required_fields():
+    assert _projection(["text"]) == {"id", "text", "inputs"}
+    assert _projection(["annotation"]) == {"id", "annotation", "multi_label"}
+
+
+def test_record_batch_columns():
+    records = [
+        LightRecord(
+            id=1,
+            text="b",
+            annotation="neg",
+            prediction=[("neg", 0.6), ("pos", 0.4)],
+            event_timestamp=datetime.datetime(2023, 1, 2),
+        ),
+        LightRecord(
+            id=2,
+            text="a",
+            annotation="pos",
+            event_timestamp=datetime.datetime(2023, 1, 1),
+        ),
+    ]
+    batch = RecordBatch.from_records(records)
+    assert batch.labels == ["neg", "pos"]
+    assert batch.label_counts() == {"neg": 1, "pos": 1}
+    assert batch.label_codes.tolist() == [0, 1]
+    assert batch.max_scores()[0] == 0.6
+    assert np.isnan(batch.max_scores()[1])
+
+    batch = batch.take(batch.argsort("event_timestamp"))
+    assert batch.text.tolist() == ["a", "b"]
+    assert [rec.id for rec in batch.records] == [2, 1]
+
+
+def test_record_batch_without_labels():
+    batch = RecordBatch.from_records([LightRecord(id=1, text="a"), LightRecord(id=2, text="b")])
+    assert batch.labels == []
+    assert batch.label_codes.tolist() == [-1, -1]
+    assert np.isnan(batch.max_scores()).all()
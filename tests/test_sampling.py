@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+
+from argilla_plugins.active_learning.sampling import LabelReservoir, k_center
+from argilla_plugins.utils.records import LightRecord
+
+
+def _records():
+    return [
+        LightRecord(
+            id=idx,
+            text=f"text {idx}",
+            annotation=["positive", "negative"][: 1 + idx % 2],
+            multi_label=True,
+        )
+        for idx in range(200)
+    ]
+
+
+def test_label_reservoir_is_bounded_per_label():
+    reservoir = LabelReservoir(10).update(_records())
+    assert reservoir.labels == ["negative", "positive"]
+    assert len(reservoir.sample("positive")) == 10
+    assert len(reservoir.sample("negative")) == 10
+    assert all("negative" in rec.annotation for rec in reservoir.sample("negative"))
+
+
+def test_label_reservoir_is_order_independent_and_mergeable():
+    records = _records()
+    expected = LabelReservoir(10).update(records).sample("positive")
+
+    shuffled = records[:]
+    random.Random(42).shuffle(shuffled)
+    assert LabelReservoir(10).update(shuffled).sample("positive") == expected
+
+    # reservoirs of pages merge into the reservoir of all records
+    merged = []
+    for i in range(0, len(records), 30):
+        merged = LabelReservoir(10).update(merged + records[i : i + 30]).records()
+    assert LabelReservoir(10).update(merged).sample("positive") == expected
+
+    assert LabelReservoir(10, seed=1).update(records).sample("positive") != expected
+
+
+def test_k_center_covers_clusters():
+    rng = np.random.default_rng(0)
+    centers = np.eye(3)
+    embeddings = np.concatenate(
+        [center + rng.normal(scale=0.01, size=(20, 3)) for center in centers]
+    )
+    picks = k_center(embeddings, 3)
+    assert sorted(picks // 20) == [0, 1, 2]
+    assert len(k_center(embeddings, 100)) == len(embeddings)
@@ -0,0 +1,58 @@
+import multiprocessing
+
+from argilla_plugins.utils.records import LightRecord
+from argilla_plugins.utils.sharding import ShardCoordinator, shard_of
+
+
+def _claim_shard(lease_path, queue):
+    sharding = ShardCoordinator(n_shards=3, lease_path=lease_path)
+    queue.put(sharding.acquire())
+
+
+def test_workers_claim_distinct_shards(tmp_path):
+    lease_path = str(tmp_path / "leases.db")
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_claim_shard, args=(lease_path, queue))
+        for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    shards = [queue.get() for _ in processes]
+
+    # three workers get a shard, the fourth waits for a lease to expire
+    assert sorted(shard for shard in shards if shard is not None) == [0, 1, 2]
+    assert shards.count(None) == 1
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    lease_path = str(tmp_path / "leases.db")
+    worker = ShardCoordinator(n_shards=1, lease_path=lease_path, lease_ttl_in_seconds=-1)
+    assert worker.acquire() == 0
+    other = ShardCoordinator(n_shards=1, lease_path=lease_path)
+    assert other.acquire() == 0
+    # the lease of the first worker moved to the other worker
+    assert worker.acquire() is None
+
+
+def test_shards_partition_records():
+    records = [LightRecord(id=idx) for idx in range(100)]
+    shards = [ShardCoordinator(n_shards=4, shard_index=idx) for idx in range(4)]
+    for sharding in shards:
+        sharding.acquire()
+    ids = [rec.id for sharding in shards for rec in sharding.filter(records)]
+    assert sorted(ids) == list(range(100))
+    assert shard_of("a", 4) == shard_of("a", 4)
+
+
+def test_renew_detects_a_lost_shard(tmp_path):
+    lease_path = str(tmp_path / "leases.db")
+    worker = ShardCoordinator(n_shards=2, lease_path=lease_path, lease_ttl_in_seconds=-1)
+    assert worker.acquire() == 0
+    assert worker.renew()
+    # the expired lease is taken over during the run of the first worker
+    other = ShardCoordinator(n_shards=2, lease_path=lease_path)
+    assert other.acquire() == 0
+    assert not worker.renew()
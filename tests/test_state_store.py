@@ -0,0 +1,33 @@
+import pytest
+
+from argilla_plugins.utils.state_store import (
+    FileStateStore,
+    SQLiteStateStore,
+    StateStore,
+    get_state_store,
+)
+
+
+@pytest.mark.parametrize("path", ["state", "state.db"])
+def test_state_store_round_trip(tmp_path, path):
+    store = get_state_store(str(tmp_path / path))
+    assert isinstance(store, SQLiteStateStore if path.endswith(".db") else FileStateStore)
+    assert store.load("token_copycat/test-dataset") == {}
+
+    state = {"seen_words": {"Paris"}, "idx": 2}
+    store.save("token_copycat/test-dataset", state)
+    # a new store on the same path resumes the state
+    store = get_state_store(str(tmp_path / path))
+    assert store.load("token_copycat/test-dataset") == state
+
+    store.delete("token_copycat/test-dataset")
+    assert store.load("token_copycat/test-dataset") == {}
+
+
+def test_incomplete_state_store_fails_on_instantiation():
+    class LoadOnlyStore(StateStore):
+        def load(self, key):
+            return {}
+
+    with pytest.raises(TypeError):
+        LoadOnlyStore()
@@ -0,0 +1,170 @@
+import itertools
+import random
+
+from argilla_plugins.programmatic_labelling.token_copycat import (
+    WordIndex,
+    _WorkerPool,
+    apply_word_dict_kb,
+    copy_spans,
+    resolve_span_overlap,
+    spans_changed,
+    spans_known,
+    token_copycat,
+    token_offsets,
+)
+
+
+def test_resolve_span_overlap_keeps_longest_span():
+    spans = [("A", 0, 3, 0), ("B", 2, 8, 0), ("C", 10, 12, 0)]
+    assert resolve_span_overlap(spans) == [("B", 2, 8, 0), ("C", 10, 12, 0)]
+
+
+def test_resolve_span_overlap_removes_nested_spans():
+    spans = [("LOC", 0, 20, 0), ("PER", 5, 10, 0)]
+    assert resolve_span_overlap(spans) == [("LOC", 0, 20, 0)]
+
+
+def test_resolve_span_overlap_matches_pairwise_check():
+    rng = random.Random(0)
+    spans = []
+    for _ in range(300):
+        start = rng.randrange(200)
+        spans.append(("LABEL", start, start + rng.randint(1, 15), 0))
+
+    expected = []
+    for span in sorted(spans, key=lambda span: (span[2] - span[1], -span[1]), reverse=True):
+        if all(span[2] <= kept[1] or kept[2] <= span[1] for kept in expected):
+            expected.append(span)
+    assert resolve_span_overlap(spans) == sorted(expected, key=lambda span: span[1])
+
+
+def test_resolve_span_overlap_keeps_adjacent_spans():
+    spans = [("A", 4, 8), ("B", 0, 4), ("A", 4, 8)]
+    assert resolve_span_overlap(spans) == [("B", 0, 4), ("A", 4, 8)]
+
+
+def test_apply_word_dict_kb_matches_token_boundaries():
+    text = "Paris and Parisian food in Paris"
+    offsets = token_offsets(text, text.split())
+    word_dict = {"Paris": {"label": "LOC", "score": 0}}
+    assert apply_word_dict_kb(text, offsets, word_dict) == [
+        ("LOC", 0, 5, 0),
+        ("LOC", 27, 32, 0),
+    ]
+
+
+def test_apply_word_dict_kb_unicode_word_boundaries():
+    text = "Москва и Москвич"
+    offsets = token_offsets(text)
+    word_dict = {"москва": {"label": "LOC", "score": 1.0}}
+    assert apply_word_dict_kb(text, offsets, word_dict) == []
+    assert apply_word_dict_kb(text, offsets, word_dict, case_sensitive=False) == [
+        ("LOC", 0, 6, 1.0)
+    ]
+
+
+def test_apply_word_dict_kb_case_insensitive_keeps_offsets():
+    # "İ" lowercases to two characters, which must not shift the spans after it
+    text = "İstanbul is nice"
+    offsets = token_offsets(text)
+    word_dict = {"nice": {"label": "ADJ", "score": 1.0}, "istanbul": {"label": "LOC", "score": 1.0}}
+    assert apply_word_dict_kb(text, offsets, word_dict, case_sensitive=False) == [
+        ("ADJ", 12, 16, 1.0)
+    ]
+    assert apply_word_dict_kb(
+        text, offsets, {"İSTANBUL": {"label": "LOC", "score": 1.0}}, case_sensitive=False
+    ) == [("LOC", 0, 8, 1.0)]
+
+
+def test_copy_spans_only_returns_changed_records():
+    text = "Paris is in France"
+    tokens = text.split()
+    kb = {"Paris": {"label": "LOC", "score": 0.0}}
+    prediction = [("LOC", 0, 5, 0.0)]
+    assert copy_spans(text, tokens, prediction, None, word_dict_kb_predictions=kb) is None
+    assert copy_spans(text, tokens, None, None, word_dict_kb_predictions={}) is None
+    assert copy_spans(text, tokens, None, None, word_dict_kb_predictions=kb) == (
+        [("LOC", 0, 5, 0.0)],
+        None,
+    )
+
+
+def test_word_index_matches_token_ngrams():
+    text = "She moved to New York, not York."
+    offsets = token_offsets(text, ["She", "moved", "to", "New", "York", ",", "not", "York", "."])
+    index = WordIndex(
+        {
+            "new york": {"label": "LOC", "score": 1.0},
+            "York": {"label": "PER", "score": 0.5},
+            "moved": {"label": "VERB", "score": 0.0},
+        },
+        included_labels=["LOC", "PER"],
+        case_sensitive=False,
+    )
+    assert apply_word_dict_kb(text, offsets, index) == [
+        ("LOC", 13, 21, 1.0),
+        ("PER", 17, 21, 0.5),
+        ("PER", 27, 31, 0.5),
+    ]
+
+
+def test_worker_pool_is_reused_until_the_kb_changes():
+    text = "Paris is in France"
+    items = [(text, text.split(), None, None)] * 5
+    kb = {"Paris": {"label": "LOC", "score": 0.0}}
+    kwargs = {"word_dict_kb_predictions": WordIndex(kb), "word_dict_kb_annotations": None}
+
+    pool = _WorkerPool(2)
+    try:
+        batches = [items[:2], items[2:4], items[4:]]
+        results = list(itertools.chain.from_iterable(pool.map(batches, kwargs)))
+        assert results == [copy_spans(*item, **kwargs) for item in items]
+        executor = pool._executor
+
+        # an equal KB keeps the workers, a changed KB restarts them
+        same = {"word_dict_kb_predictions": WordIndex(kb), "word_dict_kb_annotations": None}
+        assert len(list(pool.map(batches, same))) == 3
+        assert pool._executor is executor
+        kb["France"] = {"label": "LOC", "score": 0.0}
+        changed = {"word_dict_kb_predictions": WordIndex(kb), "word_dict_kb_annotations": None}
+        assert list(pool.map([items[:1]], changed)) == [
+            [([("LOC", 0, 5, 0.0), ("LOC", 12, 18, 0.0)], None)]
+        ]
+        assert pool._executor is not executor
+    finally:
+        pool.shutdown()
+
+
+def test_spans_changed_ignores_order_and_span_type():
+    new = [("LOC", 0, 5, 0.0), ("PER", 10, 14, 0.5)]
+    assert not spans_changed(new, [["PER", 10, 14, 0.5], ("LOC", 0, 5, 0.0)])
+    assert spans_changed(new, [("LOC", 0, 5, 0.0)])
+    assert spans_changed(new, [("LOC", 0, 5, 0.0), ("PER", 10, 14, 0.6)])
+    assert spans_changed(new, None)
+    assert not spans_changed([], None)
+
+
+def test_spans_known_only_for_resolved_old_spans():
+    old = [("LOC", 0, 5, 0.0), ["PER", 10, 14, 0.5]]
+    assert spans_known([("LOC", 0, 5, 0.0), ("PER", 10, 14, 0.5)], old)
+    assert not spans_known([("LOC", 0, 5, 0.0), ("LOC", 20, 25, 0.0)], old)
+    assert not spans_known([("LOC", 0, 5, 0.0)], None)
+    # overlapping old spans are resolved by `copy_spans`
+    assert not spans_known([("LOC", 0, 5, 0.0)], [("LOC", 0, 5, 0.0), ("PER", 3, 8, 0.5)])
+    text = "Paris is in France"
+    kb = {"Paris": {"label": "LOC", "score": 0.0}}
+    prediction = [("LOC", 0, 5, 0.0), ("LOC", 3, 8, 0.0)]
+    assert copy_spans(text, text.split(), prediction, None, word_dict_kb_predictions=kb) == (
+        [("LOC", 0, 5, 0.0)],
+        None,
+    )
+
+
+def test_memory_budget_is_split_over_the_kbs_in_use():
+    plugin = token_copycat("dataset", memory_budget=1000)
+    assert plugin.query_params["word_dict_kb_predictions"].max_bytes == 500
+    assert plugin.query_params["word_dict_kb_annotations"].max_bytes is None
+
+    plugin = token_copycat("dataset", copy_annotations=True, memory_budget=900)
+    assert plugin.query_params["word_dict_kb_predictions"].max_bytes == 300
+    assert plugin.query_params["word_dict_kb_annotations"].max_bytes == 300
@@ -0,0 +1,10 @@
+from argilla_plugins.reporting import datapane_report
+
+plugin = datapane_report(
+    name="plugin-test",
+    query=None,
+    output_path="plugin-test-report.html",
+    report_interval_in_seconds=60,
+    execution_interval_in_seconds=5,
+)
+plugin.start()
@@ -0,0 +1,12 @@
+from argilla_plugins.reporting import great_expectations_report
+
+plugin = great_expectations_report(
+    name="plugin-test",
+    query=None,
+    output_path="plugin-test-validation.json",
+    allowed_labels=["positive", "negative"],
+    score_range=(0, 1),
+    vector_dimensions={"vector": 384},
+    execution_interval_in_seconds=5,
+)
+plugin.start()
@@ -0,0 +1,15 @@
+from argilla_plugins.inference import predictor
+
+plugin = predictor(
+    name="plugin-test",
+    query=None,
+    model="distilbert-base-uncased-finetuned-sst-2-english",
+    task="text-classification",
+    device="cpu",
+    quantize=True,
+    batch_size=32,
+    max_latency_in_seconds=0.5,
+    chunk_size=1000,
+    execution_interval_in_seconds=5,
+)
+plugin.start()